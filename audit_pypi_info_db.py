@@ -1,19 +1,42 @@
+import collections
 import csv
+import io
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 import argparse
 import textwrap
 
+from pypi_schema import SCHEMA
+from duckdb_audit import audit_with_duckdb
+from csv_chunks import find_chunk_boundaries
+
+CHUNKS_PER_WORKER = 4 # more chunks than workers so a slow chunk doesn't hold up the rest
+CHUNK_END = 'CSAPP-END-OF-CHUNK' # line added after a chunk; read back as its own row if the chunk ended on a record
+
+# yyyy-mm-dd with a day every month has; anything else goes through strptime
+SIMPLE_DATE = re.compile(r'[1-9][0-9]{3}-(0[1-9]|1[0-2])-(0[1-9]|1[0-9]|2[0-8])')
+
 def get_args():
     parser = argparse.ArgumentParser(
         description="Removes errors in records from the data set.",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog=textwrap.dedent('''Examples:
         py audit_pypi_info_db.py -f "pypi_info_db.csv"
+        py audit_pypi_info_db.py -f "pypi_info_db.csv" --engine duckdb
+        py audit_pypi_info_db.py -f "pypi_info_db.csv" --workers 1
+        py audit_pypi_info_db.py -f "pypi_info_db.csv" --quarantine "bad_rows.csv"
         ''')
     )
 
     parser.add_argument('-f', '--file', action='store', type=str, required=True, help="path to data set CSV file")
+    parser.add_argument('--engine', action='store', type=str, choices=['python', 'duckdb'], default='python', help="audit row by row in python, or the whole file at once with duckdb; default python")
+    parser.add_argument('--workers', action='store', type=int, default=os.cpu_count(), help="processes auditing chunks of the file with the python engine; default one per cpu")
+    parser.add_argument('--quarantine', action='store', type=str, default='quarantine_pypi_info_main_db.csv', help="CSV file for rejected rows; error counts are saved next to it as JSON")
 
     args = parser.parse_args() # parse arguments
 
@@ -26,189 +49,257 @@ def main():
     pypi_db_file = args['file']
     
     new_csv_file_name = 'new_pypi_info_main_db.csv'
+    quarantine_file_name = args['quarantine']
+    summary_file_name = os.path.splitext(quarantine_file_name)[0] + '.json'
+
+    if args['engine'] == 'duckdb':
+        error_counts = audit_with_duckdb(pypi_db_file, new_csv_file_name, quarantine_file_name, SCHEMA)
+        if error_counts is None:
+            return
+    elif args['workers'] > 1:
+        error_counts = audit_in_chunks(pypi_db_file, new_csv_file_name, quarantine_file_name, args['workers'])
+    else:
+        error_counts = audit_file(pypi_db_file, new_csv_file_name, quarantine_file_name)
+
+    print(f"file saved: {new_csv_file_name}")
+    print(f"file saved: {quarantine_file_name}")
+
+    save_error_summary(summary_file_name, pypi_db_file, args['engine'], error_counts)
+
+    print(f"skipped {sum(error_counts.values())} rows")
+
+def audit_file(pypi_db_file, new_csv_file_name, quarantine_file_name):
+    """Audits the data set row by row in this process
+
+    Parameters:
+    -----------
+    pypi_db_file : str
+        path to data set CSV file
+    new_csv_file_name : str
+        audited CSV file
+    quarantine_file_name : str
+        rejected rows CSV file
 
+    Returns:
+    --------
+    error_counts : collections.Counter
+        reason code: total rows rejected for it
+    """
 
     with open(pypi_db_file, 'r', encoding='utf-8') as input_csv_file:
-        with open(new_csv_file_name, 'w', encoding='utf-8') as new_csv_file:
+        with open(new_csv_file_name, 'w', encoding='utf-8') as new_csv_file, \
+             open(quarantine_file_name, 'w', encoding='utf-8') as quarantine_file:
             csv_reader = csv.reader(input_csv_file)
             csv_writer = csv.writer(new_csv_file, lineterminator='\n')
+            quarantine_writer = csv.writer(quarantine_file, lineterminator='\n')
+
+            headers = next(csv_reader, None)
+            if headers == None:
+                return collections.Counter() # empty file.. empty outputs
+
+            headers = eval_headers(headers)
+            csv_writer.writerow(headers) # add headers to new file
+            quarantine_writer.writerow(['reason'] + headers)
+
+            error_counts = audit_rows(csv_reader, csv_writer, quarantine_writer, compile_schema(SCHEMA))
+
+    return error_counts
+
+def audit_rows(csv_reader, csv_writer, quarantine_writer, validate_row):
+    """Writes each row that passes the audit, and each row that doesn't to the quarantine
+
+    Quarantined rows are written as read, after a reason code: the
+    first field that failed, or 'columns' for the wrong number of columns.
+
+    Parameters:
+    -----------
+    csv_reader : csv.reader
+        rows to audit, without headers
+    csv_writer : csv.writer
+        audited rows
+    quarantine_writer : csv.writer
+        rejected rows
+    validate_row : function
+        from compile_schema()
+
+    Returns:
+    --------
+    error_counts : collections.Counter
+        reason code: total rows rejected for it
+    """
+
+    error_counts = collections.Counter()
+
+    for row in csv_reader:
+        modified_row, error_field = validate_row(row)
+        if error_field:
+            error_counts[error_field] += 1
+            quarantine_writer.writerow([error_field] + row)
+            continue # skip row
+
+        csv_writer.writerow(modified_row) # write each row as soon as it passes
+
+    return error_counts
+
+def audit_chunk(pypi_db_file, start, end, chunk_file_name, quarantine_chunk_file_name, check_end=True):
+    """Audits the rows in one byte range of the data set; runs in a worker process
+
+    An unbalanced quote, e.g. a torn row, puts the chunk boundaries
+    after it inside records. A line added after the chunk tells: it's
+    read back as a row of its own only if the chunk ended on a record.
+
+    Parameters:
+    -----------
+    pypi_db_file : str
+        path to data set CSV file
+    start : int
+        byte offset of the first row
+    end : int
+        byte offset after the last row
+    chunk_file_name : str
+        audited rows of this chunk
+    quarantine_chunk_file_name : str
+        rejected rows of this chunk
+    check_end : bool
+        check the chunk ended on a record; default True, not needed for the last chunk
+
+    Returns:
+    --------
+    error_counts : collections.Counter
+        reason code: total rows in the chunk rejected for it
+    aligned : bool
+        False if the chunk ended inside a record, so the next chunk starts in one
+    """
+
+    with open(pypi_db_file, 'rb') as input_csv_file:
+        input_csv_file.seek(start)
+        chunk = input_csv_file.read(end - start).decode('utf-8')
+
+    if check_end:
+        chunk += CHUNK_END + '\n'
+
+    # newline=None turns \r\n into \n like reading the whole file in text mode
+    csv_reader = csv.reader(io.StringIO(chunk, newline=None))
+    aligned = not check_end
+
+    def chunk_rows():
+        nonlocal aligned
+        for row in csv_reader:
+            if row == [CHUNK_END]:
+                aligned = True
+                return
+            yield row
+
+    with open(chunk_file_name, 'w', encoding='utf-8') as chunk_file, \
+         open(quarantine_chunk_file_name, 'w', encoding='utf-8') as quarantine_chunk_file:
+        csv_writer = csv.writer(chunk_file, lineterminator='\n')
+        quarantine_writer = csv.writer(quarantine_chunk_file, lineterminator='\n')
+        error_counts = audit_rows(chunk_rows(), csv_writer, quarantine_writer, compile_schema(SCHEMA))
+
+    return error_counts, aligned
+
+def join_chunk_files(file_name, headers, chunk_file_names):
+    """Writes the headers, then each chunk file in order"""
+
+    with open(file_name, 'w', encoding='utf-8') as joined_file:
+        csv.writer(joined_file, lineterminator='\n').writerow(headers)
+        for chunk_file_name in chunk_file_names:
+            with open(chunk_file_name, 'r', encoding='utf-8') as chunk_file:
+                shutil.copyfileobj(chunk_file, joined_file)
+
+def audit_in_chunks(pypi_db_file, new_csv_file_name, quarantine_file_name, workers):
+    """Audits the data set in chunks across worker processes
+
+    The file is split into byte ranges on record boundaries, each
+    range is audited into its own files, and the files are joined in
+    their original order. If a chunk ended inside a record the file is
+    audited again in one process, so the result never depends on the
+    number of workers.
+
+    Parameters:
+    -----------
+    pypi_db_file : str
+        path to data set CSV file
+    new_csv_file_name : str
+        audited CSV file
+    quarantine_file_name : str
+        rejected rows CSV file
+    workers : int
+        total worker processes
+
+    Returns:
+    --------
+    error_counts : collections.Counter
+        reason code: total rows rejected for it
+    """
 
-            row_count = 1
-            skipped_rows = 0
-            all = []
-
-            for row in csv_reader:
-                if row_count == 1:
-                    modified_row = eval_headers(row)
-                    all.append(modified_row) # add headers to new file
-        
-                else:
-                    # work csv rows
-                    
-                    # skip rows with incorrect number of items on row
-                    modified_row = eval_rows(row)
-                    if modified_row == 'error':
-                        skipped_rows += 1
-                        continue # skip row
-                    else:
-                        # evaluate row values
-                        error = False
-                        
-                        modified_row, error = eval_dependent_repos_count(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row, error = eval_dependents_count(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_deprecation_reason(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_description(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row, error = eval_forks(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_homepage(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_keywords(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_language(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_latest_download_url(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_latest_release_number(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_latest_release_published_at(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_latest_stable_release_number(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_latest_stable_release_published_at(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_license_normalized(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_licenses(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_name(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_normalized_licenses(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_package_manager_url(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_platform(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row, error = eval_rank(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_repository_license(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_repository_status(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_repository_url(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row, error = eval_stars(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row, error = eval_total_versions(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        modified_row = eval_maintainers(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        error = eval_latest_upload_date(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        error = eval_latest_upload_time(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-                        error = eval_first_upload_date(modified_row)
-                        if error == True:
-                            skipped_rows += 1
-                            continue # skip row
-
-
-                        all.append(modified_row) # add new data for new csv file
-                
-                row_count += 1
-            
-            csv_writer.writerows(all) # write new csv file
-            print(f"file saved: {new_csv_file_name}")
-    
-    print(f"skipped {skipped_rows} rows")
-  
+    with open(pypi_db_file, 'r', encoding='utf-8') as input_csv_file:
+        headers = next(csv.reader(input_csv_file), None)
+
+    if headers == None:
+        return audit_file(pypi_db_file, new_csv_file_name, quarantine_file_name) # empty file.. nothing to split
+
+    headers = eval_headers(headers)
+
+    boundaries = find_chunk_boundaries(pypi_db_file, workers * CHUNKS_PER_WORKER)
+    chunk_file_names = [f"{new_csv_file_name}.chunk{i}" for i in range(len(boundaries))]
+    quarantine_chunk_file_names = [f"{quarantine_file_name}.chunk{i}" for i in range(len(boundaries))]
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(audit_chunk, pypi_db_file, start, end, chunk_file_name, quarantine_chunk_file_name, i < len(boundaries) - 1)
+                       for i, ((start, end), chunk_file_name, quarantine_chunk_file_name)
+                       in enumerate(zip(boundaries, chunk_file_names, quarantine_chunk_file_names))]
+            results = [future.result() for future in futures]
+
+        if not all(aligned for chunk_error_counts, aligned in results):
+            print("chunk boundaries fell inside a record, e.g. after an unbalanced quote; auditing in one process")
+            return audit_file(pypi_db_file, new_csv_file_name, quarantine_file_name)
+
+        error_counts = sum((chunk_error_counts for chunk_error_counts, aligned in results), collections.Counter())
+
+        join_chunk_files(new_csv_file_name, headers, chunk_file_names)
+        join_chunk_files(quarantine_file_name, ['reason'] + headers, quarantine_chunk_file_names)
+    finally:
+        for chunk_file_name in chunk_file_names + quarantine_chunk_file_names:
+            if os.path.exists(chunk_file_name):
+                os.remove(chunk_file_name)
+
+    print(f"audited {len(boundaries)} chunks with {workers} workers")
+
+    return error_counts
+
+def save_error_summary(summary_file_name, pypi_db_file, engine, error_counts):
+    """Saves how many rows were rejected for each reason to a JSON file
+
+    Every field is listed, with 0 if no row failed on it, so summaries
+    from different runs line up.
+
+    Parameters:
+    -----------
+    summary_file_name : str
+        JSON file
+    pypi_db_file : str
+        path to data set CSV file
+    engine : str
+        engine that ran the audit
+    error_counts : collections.Counter
+        reason code: total rows rejected for it
+    """
+
+    reasons = ['columns'] + [name for name, kind in SCHEMA]
+    summary = {'file': pypi_db_file,
+               'audited_at': datetime.now().isoformat(timespec='seconds'),
+               'engine': engine,
+               'rows_quarantined': sum(error_counts.values()),
+               'errors': {reason: error_counts.get(reason, 0) for reason in reasons}}
+
+    with open(summary_file_name, 'w', encoding='utf-8') as summary_file:
+        json.dump(summary, summary_file, indent=4)
+
+    print(f"file saved: {summary_file_name}")
+    for reason, count in error_counts.most_common():
+        print(f"    {reason}: {count}")
 
 def eval_headers(row):
     # count columns
@@ -219,314 +310,87 @@ def eval_headers(row):
 
     return row
 
-def eval_rows(row):
-    row_count = len(row)
-
-    if row_count != 30:
-        print(f"number of rows: {row_count} not equal to 30")
-        print(row)
-
-        row = 'error' # mark row as in error and skip it
-
-    return row
-
-def eval_string(string):
-    # value should be a string
-    if string == "" or string == None:
-        string = 'none'
-
-    if type(string) != str:
-        string = str(string)
-
-    return string
-
-def eval_num(num):
+def is_number(value):
     # value should be an int as a string
-    if num == '' or num == None:
-        num = '0'
+    if value.isdecimal():
+        return True
 
-    error = False
     try:
-        # value should be an int
-        test = int(num)
-    except:
-        error = True
+        int(value)
+    except ValueError:
+        return False
 
-    num = str(num)
+    return True
 
-    return num, error
+def is_date(value):
+    # value should be yyyy-mm-dd
+    if SIMPLE_DATE.fullmatch(value):
+        return True
 
-def eval_url(url):
-    if url == '' or url == None:
-        url = 'none'
-
-    if type(url) != str:
-        url = str(url)
-    
-    return url
-
-def eval_list(check_list):
-    check_list = check_list.replace('[', '')
-    check_list = check_list.replace(']', '')
-    
-    if check_list == '' or check_list == None:
-        check_list = 'none'
-
-    # return comma seperated values
-    return check_list
-
-def eval_date(date):
-    
-    error = False
+    # single digit months and days, days 29 to 31, leap years..
     try:
-        date_df = datetime.strptime(date, '%Y-%m-%d')
-    except:
-        error = True
-    
-    return error
-
-###########################
-
-def eval_dependent_repos_count(row):
-    dependent_repos_count = row[0]
-    
-    dependent_repos_count, error = eval_num(dependent_repos_count)
-    row[0] = dependent_repos_count
-
-    return row, error
-
-def eval_dependents_count(row):
-    dependents_count = row[1]
-
-    dependents_count, error = eval_num(dependents_count)
-    row[1] = dependents_count
-
-    return row, error
-
-def eval_deprecation_reason(row):
-    deprecation_reason = row[2]
-
-    deprecation_reason = eval_string(deprecation_reason)
-    row[2] = deprecation_reason
-
-    return row
-
-def eval_description(row):
-    description = row[3]
-
-    description = eval_string(description)
-    row[3] = description
-
-    return row
-
-def eval_forks(row):
-    forks = row[4]
-
-    forks, error = eval_num(forks)
-    row[4] = forks
-
-    return row, error
-
-def eval_homepage(row):
-    url = row[5]
-    
-    url = eval_url(url)
-    row[5] = url
-
-    return row
-
-def eval_keywords(row):
-    keywords = row[6]
-
-    keywords = eval_list(keywords)
-    row[6] = keywords
-
-    return row
-
-def eval_language(row):
-    language = row[7]
-
-    language = eval_string(language)
-    row[7] = language
-
-    return row
-
-def eval_latest_download_url(row):
-    latest_download_url = row[8]
-
-    latest_download_url = eval_url(latest_download_url)
-    row[8] = latest_download_url
-    
-    return row
+        datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return False
 
-def eval_latest_release_number(row):
-    latest_release_number = row[9]
+    return True
 
-    latest_release_number = eval_string(latest_release_number)
-    row[9] = latest_release_number
+def is_time(value):
+    # value should be HH:MM:SS
+    return value.count(':') == 2
 
-    return row
+def compile_schema(schema):
+    """Builds one function that audits a whole row
 
-def eval_latest_release_published_at(row):
-    latest_release_published_at = row[10]
+    Empty values get their column's default, brackets are stripped
+    from lists, and numbers, dates and times are checked in column
+    order so the first bad field is reported.
 
-    latest_release_published_at = eval_string(latest_release_published_at)
-    row[10] = latest_release_published_at
+    Parameters:
+    -----------
+    schema : list
+        (field name, kind) tuples from pypi_schema
 
-    return row
+    Returns:
+    --------
+    validate_row : function
+        takes a csv row and returns (row, error_field); error_field is
+        None if the row passed, 'columns' for the wrong number of columns.
+        A row that passed comes back cleaned, a rejected row as read
+    """
 
-def eval_latest_stable_release_number(row):
-    latest_stable_release_number = row[11]
+    total_columns = len(schema)
+    none_columns = tuple(i for i, (name, kind) in enumerate(schema) if kind in ('text', 'url'))
+    list_columns = tuple(i for i, (name, kind) in enumerate(schema) if kind == 'list')
+    number_columns = tuple(i for i, (name, kind) in enumerate(schema) if kind == 'number')
 
-    latest_stable_release_number = eval_string(latest_stable_release_number)
-    row[11] = latest_stable_release_number
+    checkers = {'number': is_number, 'date': is_date, 'time': is_time}
+    checks = tuple((i, name, checkers[kind]) for i, (name, kind) in enumerate(schema) if kind in checkers)
 
-    return row
+    def validate_row(row):
+        if len(row) != total_columns:
+            return row, 'columns'
 
-def eval_latest_stable_release_published_at(row):
-    latest_stable_release_published_at = row[12]
+        clean_row = row.copy()
 
-    latest_stable_release_published_at = eval_string(latest_stable_release_published_at)
-    row[12] = latest_stable_release_published_at
+        for i in none_columns:
+            if not clean_row[i]:
+                clean_row[i] = 'none'
 
-    return row
-
-def eval_license_normalized(row):
-    license_normalized = row[13]
+        for i in list_columns:
+            clean_row[i] = clean_row[i].replace('[', '').replace(']', '') or 'none'
 
-    license_normalized = eval_string(license_normalized)
-    row[13] = license_normalized
-
-    return row
-
-def eval_licenses(row):
-    licenses = row[14]
-
-    licenses = eval_string(licenses)
-    row[14] = licenses
-
-    return row
-
-def eval_name(row):
-    name = row[15]
-
-    name = eval_string(name)
-    row[15] = name
-
-    return row
+        for i in number_columns:
+            if not clean_row[i]:
+                clean_row[i] = '0'
 
-def eval_normalized_licenses(row):
-    normalized_licenses = row[16]
+        for i, name, check in checks:
+            if not check(clean_row[i]):
+                return row, name
 
-    normalized_licenses = eval_list(normalized_licenses)
-    row[16] = normalized_licenses
+        return clean_row, None
 
-    return row
-
-def eval_package_manager_url(row):
-    package_manager_url = row[17]
-    
-    package_manager_url = eval_url(package_manager_url)
-    row[17] = package_manager_url
-
-    return row
-
-def eval_platform(row):
-    platform = row[18]
-
-    platform = eval_string(platform)
-    row[18] = platform
-
-    return row
-
-def eval_rank(row):
-    rank = row[19]
-
-    rank, error = eval_num(rank)
-    row[19] = rank
-
-    return row, error
-
-def eval_repository_license(row):
-    repository_license = row[20]
-
-    repository_license = eval_string(repository_license)
-    row[20] = repository_license
-
-    return row
-
-def eval_repository_status(row):
-    repository_status = row[21]
-
-    repository_status = eval_string(repository_status)
-    row[21] = repository_status
-
-    return row
-
-def eval_repository_url(row):
-    repository_url = row[22]
-
-    repository_url = eval_url(repository_url)
-    row[22] = repository_url
-
-    return row
-
-def eval_stars(row):
-    stars =  row[23]
-    
-    stars, error = eval_num(stars)
-    row[23] = stars
-
-    return row, error
-
-def eval_status(row):
-    status = row[24]
-
-    status = eval_string(status)
-    row[24] = status
-
-    return row
-
-def eval_total_versions(row):
-    total_versions = row[25]
-
-    total_versions, error = eval_num(total_versions)
-    row[25] = total_versions
-
-    return row, error
-
-def eval_maintainers(row):
-    maintainers = row[26]
-
-    maintainers =  eval_list(maintainers)
-    row[26] = maintainers
-
-    return row
-
-def eval_latest_upload_date(row):
-    latest_upload_date = row[27]
-
-    error = eval_date(latest_upload_date)
-
-    return error
-
-def eval_latest_upload_time(row):
-    latest_upload_time = row[28]
-
-    parts =  latest_upload_time.split(':')
-    if len(parts) == 3:
-        error = False
-    else:
-        error = True
-
-    return error
-
-def eval_first_upload_date(row):
-    latest_upload_date = row[29]
-
-    error = eval_date(latest_upload_date)
-    
-    return error
+    return validate_row
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,153 @@
+import asyncio
+import collections
+import contextlib
+import time
+
+LATENCY_TARGET = 1.0 # seconds; slower windows stop the limit from growing
+INCREASE = 1 # requests added after each healthy window
+DECREASE = 0.5 # limit multiplied by this after a throttled request
+
+def is_overload_status(status_code):
+    """True for responses that mean the server wants fewer requests"""
+
+    return status_code == 429 or status_code >= 500
+
+def is_overload_error(exc):
+    """True for timeouts, e.g. requests' Timeout, httpx's TimeoutException or asyncio's TimeoutError"""
+
+    return any('Timeout' in cls.__name__ for cls in type(exc).__mro__)
+
+class Slot:
+    """One request running under an AIMDController"""
+
+    def __init__(self, started):
+        self.started = started
+        self.overloaded = False
+
+    def check_status(self, status_code):
+        """Marks the request overloaded for a 429 or 5xx response"""
+
+        if is_overload_status(status_code):
+            self.overloaded = True
+
+class AIMDController:
+    """Adapts how many requests run at once with additive increase, multiplicative decrease
+
+    Works like an asyncio.Semaphore whose size moves: after every
+    window of successful requests as large as the limit, with average
+    latency under the target, the limit grows by one. A 429, 5xx or
+    timeout cuts it in half. Requests started before the last cut
+    don't cut it again, so one burst of failures counts once. Every
+    change is printed.
+
+        async with controller.slot() as slot:
+            response = await asyncio.to_thread(session.get, url)
+            slot.check_status(response.status_code)
+
+    With minimum and maximum equal to initial the limit never moves.
+
+    Parameters:
+    -----------
+    name : str
+        printed with each change, e.g. the host
+    initial : int
+        starting limit
+    minimum : int
+        lowest limit
+    maximum : int
+        highest limit
+    latency_target : float
+        seconds; default LATENCY_TARGET
+    """
+
+    def __init__(self, name, initial, minimum=1, maximum=100, latency_target=LATENCY_TARGET):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.latency_target = latency_target
+
+        self.in_flight = 0
+        self.waiters = collections.deque()
+
+        self.window_successes = 0
+        self.window_latency = 0.0
+        self.last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+
+    async def acquire(self):
+        """Wait for a free slot under the current limit"""
+
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.wake() # hand the free slot to the next waiter
+                raise
+            finally:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+
+        self.in_flight += 1
+
+        return Slot(time.monotonic())
+
+    def release(self, slot):
+        """Frees the slot and adjusts the limit from how the request went"""
+
+        self.in_flight -= 1
+        latency = time.monotonic() - slot.started
+
+        if slot.overloaded:
+            if slot.started >= self.last_decrease:
+                self.set_limit(max(self.minimum, self.limit * DECREASE), "throttled")
+                self.decreases += 1
+                self.last_decrease = time.monotonic()
+            self.window_successes = 0
+            self.window_latency = 0.0
+        else:
+            self.window_successes += 1
+            self.window_latency += latency
+            if self.window_successes >= int(self.limit):
+                average_latency = self.window_latency / self.window_successes
+                if average_latency <= self.latency_target and self.limit < self.maximum:
+                    self.set_limit(min(self.maximum, self.limit + INCREASE), f"healthy; {average_latency:.2f} seconds average")
+                    self.increases += 1
+                self.window_successes = 0
+                self.window_latency = 0.0
+
+        self.wake()
+
+    def set_limit(self, limit, reason):
+        if int(limit) != int(self.limit):
+            print(f"{self.name} concurrency {int(self.limit)} -> {int(limit)}; {reason}")
+        self.limit = limit
+
+    def wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Runs one request in a slot; timeouts raised inside count as throttled"""
+
+        slot = await self.acquire()
+        try:
+            yield slot
+        except Exception as exc:
+            if is_overload_error(exc):
+                slot.overloaded = True
+            raise
+        finally:
+            self.release(slot)
+
+    def report(self):
+        return f"concurrency: {int(self.limit)}, increases: {self.increases}, decreases: {self.decreases}"
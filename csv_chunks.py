@@ -0,0 +1,74 @@
+import os
+
+BLOCK_SIZE = 1024 * 1024 # bytes read at a time while looking for a boundary
+
+def find_chunk_boundaries(csv_file, chunks):
+    """Splits a CSV file into byte ranges that start and end on a record
+
+    A newline only ends a record when an even number of quotes comes
+    before it; inside a quoted value, e.g. a description with line
+    breaks, it doesn't. Escaped quotes ("") count twice so they don't
+    change the count. This holds for files written by csv.writer, which
+    quotes every value that has a quote in it.
+
+    Parameters:
+    -----------
+    csv_file : str
+        path to CSV file
+    chunks : int
+        number of byte ranges to aim for; fewer come back for small files
+
+    Returns:
+    --------
+    boundaries : list
+        (start, end) byte offsets of each chunk, in file order; the header is left out
+    """
+
+    size = os.path.getsize(csv_file)
+
+    with open(csv_file, 'rb') as file:
+        file.readline() # skip headers
+        offsets = [file.tell()]
+
+        quotes = 0
+        position = offsets[0]
+        for target in (size * i // chunks for i in range(1, chunks)):
+            if target <= offsets[-1]:
+                continue
+
+            # count the quotes up to the target, then look for the first newline outside quotes
+            file.seek(position)
+            while position < target:
+                block = file.read(min(BLOCK_SIZE, target - position))
+                quotes += block.count(b'"')
+                position += len(block)
+
+            boundary = None
+            while boundary is None:
+                block = file.read(BLOCK_SIZE)
+                if not block:
+                    boundary = size
+                    break
+
+                start = 0
+                while True:
+                    newline = block.find(b'\n', start)
+                    if newline == -1:
+                        quotes += block.count(b'"', start)
+                        position += len(block)
+                        break
+
+                    quotes += block.count(b'"', start, newline)
+                    if quotes % 2 == 0:
+                        boundary = position + newline + 1
+                        position = boundary
+                        break
+                    start = newline + 1
+
+            if boundary >= size:
+                break
+            offsets.append(boundary)
+
+    offsets.append(size)
+
+    return [(start, end) for start, end in zip(offsets, offsets[1:]) if end > start]
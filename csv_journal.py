@@ -0,0 +1,164 @@
+import csv
+import io
+import itertools
+import json
+import os
+import time
+
+class JournaledWriter:
+    """Appends batches of rows to a csv file all or nothing
+
+    Each batch is first written to a journal file next to the csv
+    file, then appended to the csv file, and the resume cursor is saved
+    before the journal is removed. If the process dies part way, the
+    next JournaledWriter finds the journal, cuts off any torn rows and
+    appends the batch again.
+
+    Parameters:
+    -----------
+    csv_file : str
+        csv file to append to
+    field_names : list
+        csv headers
+    metrics : HarvestMetrics
+        records the time each batch takes to save; default None
+    """
+
+    def __init__(self, csv_file, field_names, metrics=None):
+        self.csv_file = csv_file
+        self.field_names = field_names
+        self.metrics = metrics
+        self.journal_file = f"{csv_file}.journal"
+        self.cursor_file = f"{csv_file}.cursor"
+
+        self.recover()
+
+    def recover(self):
+        """Finishes a batch that was interrupted by a crash"""
+
+        if not os.path.exists(self.journal_file):
+            return
+
+        with open(self.journal_file, 'r', encoding='utf-8', newline='') as journal:
+            header = json.loads(journal.readline())
+            data = journal.read()
+
+        print(f"recovering interrupted batch: {self.journal_file}")
+        self.apply(header['csv_size'], data.encode('utf-8'), header['cursor'])
+
+    def commit(self, rows, cursor):
+        """Appends a batch of rows and saves the resume cursor
+
+        Parameters:
+        -----------
+        rows : list
+            dicts with the csv headers as keys
+        cursor : dict
+            where to resume the harvest after this batch
+        """
+
+        start = time.monotonic()
+
+        csv_size = 0
+        if os.path.exists(self.csv_file):
+            csv_size = os.path.getsize(self.csv_file)
+
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=self.field_names)
+        if csv_size == 0:
+            writer.writeheader()
+        writer.writerows(rows)
+        data = out.getvalue()
+
+        # the journal only appears once it is complete
+        tmp_journal_file = f"{self.journal_file}.tmp"
+        with open(tmp_journal_file, 'w', encoding='utf-8', newline='') as journal:
+            journal.write(json.dumps({'csv_size': csv_size, 'cursor': cursor}) + '\n')
+            journal.write(data)
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(tmp_journal_file, self.journal_file)
+
+        self.apply(csv_size, data.encode('utf-8'), cursor)
+
+        if self.metrics is not None:
+            self.metrics.observe_flush(time.monotonic() - start, len(rows))
+
+        print(f"file saved: {self.csv_file}")
+
+    def apply(self, csv_size, data, cursor):
+        """Writes journaled rows at csv_size, replacing anything after it"""
+
+        mode = 'r+b' if os.path.exists(self.csv_file) else 'wb'
+        with open(self.csv_file, mode) as csv_file:
+            csv_file.truncate(csv_size)
+            csv_file.seek(csv_size)
+            csv_file.write(data)
+            csv_file.flush()
+            os.fsync(csv_file.fileno())
+
+        self.save_cursor(cursor)
+        os.remove(self.journal_file)
+
+    def save_cursor(self, cursor):
+        tmp_cursor_file = f"{self.cursor_file}.tmp"
+        with open(tmp_cursor_file, 'w', encoding='utf-8') as cursor_file:
+            json.dump(cursor, cursor_file)
+        os.replace(tmp_cursor_file, self.cursor_file)
+
+    def read_cursor(self):
+        """Returns the cursor saved with the last batch
+
+        Returns:
+        --------
+        cursor : dict
+            position and name of the last package worked, with every package before it worked too;
+            None if there is nothing to resume
+        """
+
+        if not os.path.exists(self.cursor_file):
+            return None
+
+        with open(self.cursor_file, 'r', encoding='utf-8') as cursor_file:
+            return json.load(cursor_file)
+
+    def finish(self):
+        """Removes the cursor once the harvest worked every package"""
+
+        if os.path.exists(self.cursor_file):
+            os.remove(self.cursor_file)
+
+def resume_packages(load_packages, cursor):
+    """Pairs each package with its position, starting after the cursor
+
+    The simple api list changes between runs, so the package named in
+    the cursor is looked up again rather than trusting its position.
+    If it is gone the harvest starts over and relies on the name index
+    to skip collected packages.
+
+    Parameters:
+    -----------
+    load_packages : function
+        returns a new iterator over the pypi simple api projects
+    cursor : dict
+        position and name from JournaledWriter.read_cursor
+
+    Returns:
+    --------
+    packages : iterator
+        (position, pypi_package) tuples
+    """
+
+    start = 0
+    if cursor:
+        name = cursor['name']
+        for position, pypi_package in enumerate(load_packages()):
+            if pypi_package['name'] == name:
+                start = position + 1
+                break
+
+        print(f"resuming harvest at package {start}; last package saved: {name}")
+
+    packages = enumerate(load_packages())
+
+    return itertools.islice(packages, start, None)
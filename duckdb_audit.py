@@ -0,0 +1,160 @@
+import collections
+import csv
+import sys
+
+try:
+    import duckdb # optional; only needed for the duckdb audit engine
+except ImportError:
+    duckdb = None
+
+# whitespace int() strips: str.isspace() without \x1c-\x1f
+SPACE_PATTERN = r'[\t-\r \x{85}\x{a0}\x{1680}\x{2000}-\x{200a}\x{2028}\x{2029}\x{202f}\x{205f}\x{3000}]'
+# same rules as int(): optional sign, digits, single underscores between digits
+NUMBER_PATTERN = SPACE_PATTERN + r'*[+-]?\p{Nd}+(_\p{Nd}+)*' + SPACE_PATTERN + '*'
+# strptime reads unicode digits where its pattern has \d; duckdb's strptime sees them as 0-9
+UNICODE_DIGITS = ''.join(c for c in map(chr, range(128, sys.maxunicode + 1)) if c.isdecimal())
+ASCII_DIGITS = ''.join(str(int(c)) for c in UNICODE_DIGITS)
+# same shapes strptime('%Y-%m-%d') accepts; the date itself is checked by duckdb's strptime
+DATE_PATTERN = r'\p{Nd}{4}-(1[0-2]|0[1-9]|[1-9])-(3[01]|[12]\p{Nd}|0[1-9]|[1-9]| [1-9])'
+
+def quote_name(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def quote_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+def newline_expression(name):
+    """SQL for a column's value with carriage returns turned into newlines, like the python engine reads it in text mode"""
+
+    column = quote_name(name)
+
+    return f"CASE WHEN contains({column}, chr(13)) THEN replace(replace({column}, chr(13) || chr(10), chr(10)), chr(13), chr(10)) ELSE {column} END"
+
+def value_expression(name, kind):
+    """SQL for a column's value after defaults are filled in"""
+
+    column = newline_expression(name)
+
+    if kind in ('text', 'url'):
+        return f"coalesce(nullif({column}, ''), 'none')"
+    if kind == 'list':
+        return f"coalesce(nullif(replace(replace({column}, '[', ''), ']', ''), ''), 'none')"
+    if kind == 'number':
+        return f"coalesce(nullif({column}, ''), '0')"
+
+    return column
+
+def check_expression(name, kind):
+    """SQL that is true when the column's value is valid, or None if every value is"""
+
+    value = f"coalesce({value_expression(name, kind)}, '')"
+
+    if kind == 'number':
+        return f"regexp_full_match({value}, {quote_string(NUMBER_PATTERN)})"
+    if kind == 'date':
+        # only values with non-ascii characters, which have more bytes than characters, need translating
+        digits = (f"CASE WHEN strlen({value}) = length({value}) THEN {value} "
+                  f"ELSE translate({value}, {quote_string(UNICODE_DIGITS)}, {quote_string(ASCII_DIGITS)}) END")
+        return (f"(regexp_full_match({value}, {quote_string(DATE_PATTERN)}) AND NOT starts_with({digits}, '0000') AND "
+                f"try_strptime(replace({digits}, ' ', ''), '%Y-%m-%d') IS NOT NULL)")
+    if kind == 'time':
+        return f"length({value}) - length(replace({value}, ':', '')) = 2"
+
+    return None
+
+def compile_schema_sql(schema):
+    """Builds the SQL that audits every row of the raw table at once
+
+    Parameters:
+    -----------
+    schema : list
+        (field name, kind) tuples from pypi_schema
+
+    Returns:
+    --------
+    error_sql : str
+        CASE expression naming the first bad field of a row, NULL if the row passed
+    clean_sql : str
+        select list of the row with defaults filled in
+    """
+
+    checks = [(name, check_expression(name, kind)) for name, kind in schema]
+    error_sql = ('CASE '
+                 + ' '.join(f"WHEN NOT coalesce({check}, false) THEN {quote_string(name)}" for name, check in checks if check)
+                 + ' END')
+    clean_sql = ', '.join(f"{value_expression(name, kind)} AS {quote_name(name)}" for name, kind in schema)
+
+    return error_sql, clean_sql
+
+def audit_with_duckdb(pypi_db_file, new_csv_file_name, quarantine_file_name, schema):
+    """Audits the data set with DuckDB; every core works on the file at once
+
+    Rows with the wrong number of columns, or a line the csv reader
+    can't split at all such as a torn row, are caught by the csv reader,
+    every other rule runs as one columnar query. Valid rows are written
+    in their original order, rejected rows as read to the quarantine file
+    after a reason code: the first field that failed, or 'columns'. Rows
+    with the wrong number of columns come last.
+
+    Parameters:
+    -----------
+    pypi_db_file : str
+        path to data set CSV file
+    new_csv_file_name : str
+        audited CSV file
+    quarantine_file_name : str
+        rejected rows CSV file
+    schema : list
+        (field name, kind) tuples from pypi_schema
+
+    Returns:
+    --------
+    error_counts : collections.Counter
+        reason code: total rows rejected for it, None if duckdb isn't installed or failed
+    """
+
+    if duckdb is None:
+        print("the duckdb engine needs duckdb; pip install duckdb")
+        return None
+
+    field_names = [name for name, kind in schema]
+    columns = '{' + ', '.join(f"{quote_string(name)}: 'VARCHAR'" for name in field_names) + '}'
+    rejects_sql = ', '.join(f"{newline_expression(name)} AS {quote_name(name)}" for name in field_names)
+    error_sql, clean_sql = compile_schema_sql(schema)
+
+    try:
+        with duckdb.connect() as conn:
+            # the dialect is given so the reader doesn't sniff the file, which stops on a torn row;
+            # lines it can't split go to reject_errors with the rows that have the wrong number of columns
+            conn.execute(f"""CREATE TEMP TABLE audited AS
+                             SELECT *, {error_sql} AS error_field
+                             FROM read_csv({quote_string(pypi_db_file)}, header = true, columns = {columns},
+                                           delim = ',', quote = '"', escape = '"', auto_detect = false,
+                                           strict_mode = true, null_padding = false, store_rejects = true)""")
+
+            conn.execute(f"""COPY (SELECT {clean_sql} FROM audited WHERE error_field IS NULL)
+                             TO {quote_string(new_csv_file_name)} (HEADER true, DELIMITER ',')""")
+            conn.execute(f"""COPY (SELECT error_field AS reason, {rejects_sql} FROM audited WHERE error_field IS NOT NULL)
+                             TO {quote_string(quarantine_file_name)} (HEADER true, DELIMITER ',')""")
+            error_counts = collections.Counter(dict(conn.execute("""SELECT error_field, count(*) FROM audited
+                                                                    WHERE error_field IS NOT NULL GROUP BY error_field""").fetchall()))
+
+            # the csv reader keeps the raw line of each rejected row; one line can have several errors
+            column_rejects = conn.execute("""SELECT any_value(csv_line) FROM reject_errors
+                                             GROUP BY line ORDER BY line""").fetchall()
+    except duckdb.Error as exc:
+        print(f"duckdb could not audit {pypi_db_file}; reason: {type(exc).__name__}: {exc}")
+        return None
+
+    with open(quarantine_file_name, 'a', encoding='utf-8') as quarantine_file:
+        quarantine_writer = csv.writer(quarantine_file, lineterminator='\n')
+        for (csv_line,) in column_rejects:
+            # the line is raw; turn carriage returns into newlines like the python engine reads it in text mode
+            csv_line = csv_line.replace('\r\n', '\n').replace('\r', '\n').strip('\n')
+            for row in csv.reader([csv_line]):
+                quarantine_writer.writerow(['columns'] + row)
+
+    if column_rejects:
+        error_counts['columns'] = len(column_rejects)
+
+    return error_counts
@@ -0,0 +1,253 @@
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60) # seconds
+METRICS_INTERVAL = 15 # seconds between metrics file writes
+
+def endpoint_of(url):
+    """Names the api a request url belongs to
+
+    Parameters:
+    -----------
+    url : str
+        request url
+
+    Returns:
+    --------
+    endpoint : str
+        pypi_json, pypi_html, pypi_simple, librariesio or the host name
+    """
+
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+
+    if host == 'libraries.io' or host.endswith('.libraries.io'):
+        return 'librariesio'
+
+    if host == 'pypi.org':
+        if parts.path.startswith('/pypi/'):
+            return 'pypi_json'
+        if parts.path.startswith('/project/'):
+            return 'pypi_html'
+        if parts.path.startswith('/simple'):
+            return 'pypi_simple'
+
+    return host
+
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    pairs = ','.join(f'{name}="{value}"' for name, value in labels.items())
+
+    return f"{{{pairs}}}"
+
+class Histogram:
+    """Counts observations into cumulative buckets like a Prometheus histogram
+
+    Parameters:
+    -----------
+    buckets : tuple
+        upper bounds, smallest first
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Returns (upper bound, observations <= bound) pairs ending with +Inf"""
+
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append((str(bound), total))
+        pairs.append(('+Inf', self.count))
+
+        return pairs
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.sum, 'buckets': dict(self.cumulative())}
+
+class HarvestMetrics:
+    """Collects harvest metrics and writes them to a file every few seconds
+
+    The file is a Prometheus textfile for the node exporter's textfile
+    collector when it ends in .prom, otherwise JSON. It is replaced in
+    one step so a reader never sees a partial file.
+
+    Parameters:
+    -----------
+    path : str
+        metrics file
+    interval : int
+        seconds between writes
+    labels : dict
+        labels added to every metric, e.g. the shard
+    """
+
+    def __init__(self, path, interval=METRICS_INTERVAL, labels=None):
+        self.path = path
+        self.interval = interval
+        self.labels = labels or {}
+        self.lock = threading.Lock()
+
+        self.started_at = time.time()
+        self.requests = {} # (endpoint, method): Histogram
+        self.batch_flush = Histogram()
+        self.packages_saved = 0
+
+        self.rate_limiter = None
+        self.queue_depths = None
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def observe_request(self, method, url, seconds):
+        """Records the latency of a request sent over the network"""
+
+        key = (endpoint_of(url), method.upper())
+        with self.lock:
+            if key not in self.requests:
+                self.requests[key] = Histogram()
+            self.requests[key].observe(seconds)
+
+    def observe_flush(self, seconds, rows):
+        """Records a batch of rows saved to the csv file"""
+
+        with self.lock:
+            self.batch_flush.observe(seconds)
+            self.packages_saved += rows
+
+    def watch_rate_limiter(self, rate_limiter):
+        """Reports the retries and wait time of a RateLimiter"""
+
+        self.rate_limiter = rate_limiter
+
+    def watch_queues(self, queue_depths):
+        """Reports queue depths; queue_depths returns stage: depth"""
+
+        self.queue_depths = queue_depths
+
+    def snapshot(self):
+        """Returns every metric as a dict"""
+
+        now = time.time()
+        with self.lock:
+            uptime = max(now - self.started_at, 1e-9)
+            metrics = {'timestamp': now,
+                       'labels': self.labels,
+                       'uptime_seconds': uptime,
+                       'packages_saved': self.packages_saved,
+                       'packages_per_second': self.packages_saved / uptime,
+                       'batch_flush_seconds': self.batch_flush.to_dict(),
+                       'request_seconds': [dict(endpoint=endpoint, method=method, **histogram.to_dict())
+                                           for (endpoint, method), histogram in sorted(self.requests.items())]}
+
+        if self.rate_limiter is not None:
+            metrics['librariesio'] = self.rate_limiter.stats()
+
+        if self.queue_depths is not None:
+            metrics['queue_depths'] = self.queue_depths()
+
+        return metrics
+
+    def to_prometheus(self, metrics):
+        """Formats a snapshot in the Prometheus text format"""
+
+        lines = []
+
+        def add(name, kind, help_text, samples):
+            lines.append(f"# HELP pypi_harvest_{name} {help_text}")
+            lines.append(f"# TYPE pypi_harvest_{name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"pypi_harvest_{name}{suffix}{format_labels(dict(self.labels, **labels))} {value}")
+
+        def histogram_samples(histogram, labels):
+            samples = [('_bucket', dict(labels, le=bound), count) for bound, count in histogram['buckets'].items()]
+            samples.append(('_sum', labels, histogram['sum']))
+            samples.append(('_count', labels, histogram['count']))
+            return samples
+
+        request_samples = []
+        for histogram in metrics['request_seconds']:
+            labels = {'endpoint': histogram['endpoint'], 'method': histogram['method']}
+            request_samples += histogram_samples(histogram, labels)
+
+        add('request_seconds', 'histogram', "Latency of requests sent over the network.", request_samples)
+        add('batch_flush_seconds', 'histogram', "Time to save a batch of rows to the csv file.",
+            histogram_samples(metrics['batch_flush_seconds'], {}))
+        add('packages_saved_total', 'counter', "Packages saved to the csv file.", [('', {}, metrics['packages_saved'])])
+        add('packages_per_second', 'gauge', "Packages saved per second since the harvest started.",
+            [('', {}, metrics['packages_per_second'])])
+
+        if 'librariesio' in metrics:
+            stats = metrics['librariesio']
+            add('librariesio_requests_total', 'counter', "Requests sent to libraries.io.", [('', {}, stats['requests'])])
+            add('librariesio_retries_total', 'counter', "Failed libraries.io requests retried.", [('', {}, stats['retries'])])
+            add('librariesio_backoff_seconds_total', 'counter', "Seconds waited before retries.", [('', {}, stats['backoff_time'])])
+            add('librariesio_wait_seconds_total', 'counter', "Seconds waited on the quota and retries.", [('', {}, stats['wait_time'])])
+
+        if 'queue_depths' in metrics:
+            add('queue_depth', 'gauge', "Packages waiting in front of each async harvest stage.",
+                [('', {'stage': stage}, depth) for stage, depth in metrics['queue_depths'].items()])
+
+        add('last_write_timestamp_seconds', 'gauge', "When this file was written.", [('', {}, metrics['timestamp'])])
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """Writes the metrics file, replacing the old file in one step"""
+
+        metrics = self.snapshot()
+        if self.path.endswith('.prom'):
+            text = self.to_prometheus(metrics)
+        else:
+            text = json.dumps(metrics, indent=2)
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='\n') as file:
+            file.write(text)
+        os.replace(tmp_path, self.path)
+
+    def start(self):
+        """Writes the metrics file every interval in a background thread"""
+
+        def run():
+            while not self.stopped.wait(self.interval):
+                try:
+                    self.write()
+                except OSError as exc:
+                    print(f"failed to write metrics: {self.path}; reason: {exc}")
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops the background thread and writes the final metrics"""
+
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.write()
+
+def shard_metrics_file(path, shard):
+    """Names the metrics file of one shard, e.g. harvest.prom -> harvest.shard0.prom"""
+
+    root, ext = os.path.splitext(path)
+
+    return f"{root}.shard{shard}{ext}"
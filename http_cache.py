@@ -0,0 +1,261 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+CACHE_FILE = 'http_cache.sqlite'
+CACHE_SIZE = 1024 # max cache size in MB
+
+# seconds a response is used without asking the server again
+CACHE_TTLS = {'pypi.org': 24 * 3600,
+              'libraries.io': 24 * 3600}
+DEFAULT_TTL = 3600
+
+CACHEABLE_STATUS = (200, 404)
+PRIVATE_PARAMS = ('api_key',) # never written to disk or part of the key
+
+def cache_key(method, url):
+    """Builds the cache key for a request
+
+    Parameters:
+    -----------
+    method : str
+        GET or HEAD
+    url : str
+        request url
+
+    Returns:
+    --------
+    key : str
+        method and url without private query parameters
+    """
+
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query) if name not in PRIVATE_PARAMS]
+    url = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+    return f"{method.upper()} {url}"
+
+class ResponseCache:
+    """On-disk cache of HTTP responses stored in SQLite
+
+    Responses are fresh for a time-to-live set per host. Stale
+    responses are revalidated with If-None-Match / If-Modified-Since
+    and the least recently used responses are evicted once the
+    cache grows past its max size.
+
+    Parameters:
+    -----------
+    path : str
+        SQLite file
+    max_size : int
+        max size of stored bodies in MB
+    ttls : dict
+        seconds responses stay fresh per host; default CACHE_TTLS
+    """
+
+    def __init__(self, path=CACHE_FILE, max_size=CACHE_SIZE, ttls=None):
+        self.path = path
+        self.max_bytes = max_size * 1024 * 1024
+        self.ttls = CACHE_TTLS if ttls is None else ttls
+        self.lock = threading.Lock()
+
+        # shard processes share the file; wait on their writes instead of failing
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS responses (
+                                 key TEXT PRIMARY KEY,
+                                 status INTEGER,
+                                 reason TEXT,
+                                 headers TEXT,
+                                 body BLOB,
+                                 size INTEGER,
+                                 fetched_at REAL,
+                                 accessed_at REAL)''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self.conn.commit()
+
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def get_ttl(self, url):
+        host = urlsplit(url).hostname or ''
+        for domain, ttl in self.ttls.items():
+            if host == domain or host.endswith(f".{domain}"):
+                return ttl
+
+        return DEFAULT_TTL
+
+    def lookup(self, key):
+        with self.lock:
+            return self.conn.execute('SELECT status, reason, headers, body, fetched_at FROM responses WHERE key = ?', (key,)).fetchone()
+
+    def touch(self, key, fetched_at=None):
+        with self.lock:
+            now = time.time()
+            if fetched_at is None:
+                self.conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            else:
+                self.conn.execute('UPDATE responses SET accessed_at = ?, fetched_at = ? WHERE key = ?', (now, fetched_at, key))
+            self.conn.commit()
+
+    def store(self, key, response):
+        body = zlib.compress(response.content or b'', 1)
+        headers = json.dumps(dict(response.headers))
+        size = len(body) + len(headers)
+        now = time.time()
+
+        with self.lock:
+            old = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            if old:
+                self.total_bytes -= old[0]
+
+            self.conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (key, response.status_code, response.reason, headers, body, size, now, now))
+            self.total_bytes += size
+
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+            self.conn.commit()
+
+    def evict(self):
+        """Deletes least recently used responses until the cache is 90% of its max size"""
+
+        target = self.max_bytes * 0.9
+        while self.total_bytes > target:
+            rows = self.conn.execute('SELECT key, size FROM responses ORDER BY accessed_at LIMIT 500').fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                self.total_bytes -= size
+                if self.total_bytes <= target:
+                    break
+
+            self.conn.executemany('DELETE FROM responses WHERE key = ?', evicted)
+
+    def forget(self, method, url):
+        """Removes a cached response, e.g. one that turned out to be unusable"""
+
+        key = cache_key(method, url)
+        with self.lock:
+            old = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            if old:
+                self.total_bytes -= old[0]
+                self.conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.conn.commit()
+
+    def build_response(self, url, row):
+        status, reason, headers, body, fetched_at = row
+
+        response = requests.Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(json.loads(headers))
+        response._content = zlib.decompress(body)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = url
+        response.from_cache = True
+
+        return response
+
+    def fresh(self, method, url):
+        """Returns the cached response if it is still fresh
+
+        Returns:
+        --------
+        response : requests.Response
+            cached response; None if missing or stale
+        """
+
+        key = cache_key(method, url)
+        row = self.lookup(key)
+        if not self.is_fresh(url, row):
+            return None
+
+        return self.hit(key, url, row)
+
+    def is_fresh(self, url, row):
+        return row is not None and time.time() - row[4] <= self.get_ttl(url)
+
+    def hit(self, key, url, row):
+        self.touch(key)
+        with self.lock:
+            self.hits += 1
+
+        return self.build_response(url, row)
+
+    def fetch(self, send, method, url, **kwargs):
+        """Returns a response from the cache or the network
+
+        Parameters:
+        -----------
+        send : function
+            sends the request; called as send(method, url, **kwargs)
+        method : str
+            GET or HEAD
+        url : str
+            request url
+
+        Returns:
+        --------
+        response : requests.Response
+            cached responses have from_cache set to True
+        """
+
+        key = cache_key(method, url)
+        row = self.lookup(key)
+
+        if self.is_fresh(url, row):
+            return self.hit(key, url, row)
+
+        if row is not None:
+            # stale.. ask the server if it changed
+            cached_headers = CaseInsensitiveDict(json.loads(row[2]))
+            headers = dict(kwargs.pop('headers', None) or {})
+            if 'ETag' in cached_headers:
+                headers['If-None-Match'] = cached_headers['ETag']
+            if 'Last-Modified' in cached_headers:
+                headers['If-Modified-Since'] = cached_headers['Last-Modified']
+            kwargs['headers'] = headers
+
+        response = send(method, url, **kwargs)
+
+        if response.status_code == 304 and row is not None:
+            self.touch(key, fetched_at=time.time())
+            with self.lock:
+                self.revalidated += 1
+            return self.build_response(url, row)
+
+        with self.lock:
+            self.misses += 1
+
+        if response.status_code in CACHEABLE_STATUS:
+            self.store(key, response)
+
+        response.from_cache = False
+
+        return response
+
+    def report(self):
+        with self.lock:
+            return (f"hits: {self.hits}, revalidated: {self.revalidated}, misses: {self.misses}, "
+                    f"size: {self.total_bytes / (1024 * 1024):.1f} MB")
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
@@ -0,0 +1,136 @@
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx # optional; only needed for http2
+except ImportError:
+    httpx = None
+
+class CachedSession(requests.Session):
+    """requests session that answers GET and HEAD requests from a ResponseCache
+
+    Parameters:
+    -----------
+    cache : ResponseCache
+        on-disk response cache; None sends every request
+    metrics : HarvestMetrics
+        records the latency of requests sent over the network; default None
+    timeout : float or tuple
+        seconds to connect and to wait for a response, or (connect, read); used when a request sets none
+    """
+
+    def __init__(self, cache=None, metrics=None, timeout=None):
+        super().__init__()
+        self.cache = cache
+        self.metrics = metrics
+        self.timeout = timeout
+
+    def request(self, method, url, *args, **kwargs):
+        if self.timeout is not None and not args:
+            kwargs.setdefault('timeout', self.timeout)
+
+        if self.cache is None or args or method.upper() not in ('GET', 'HEAD'):
+            return self.timed_request(method, url, *args, **kwargs)
+
+        return self.cache.fetch(self.timed_request, method, url, **kwargs)
+
+    def timed_request(self, method, url, *args, **kwargs):
+        """Sends a request over the network and records its latency"""
+
+        if self.metrics is None:
+            return super().request(method, url, *args, **kwargs)
+
+        start = time.monotonic()
+        try:
+            return super().request(method, url, *args, **kwargs)
+        finally:
+            self.metrics.observe_request(method, url, time.monotonic() - start)
+
+    def cached(self, url, method='GET'):
+        """Returns a fresh cached response without sending a request
+
+        Returns:
+        --------
+        response : requests.Response
+            cached response; None if the request has to be sent
+        """
+
+        if self.cache is None:
+            return None
+
+        return self.cache.fresh(method, url)
+
+    def forget(self, url, method='GET'):
+        """Drops a cached response that turned out to be unusable"""
+
+        if self.cache is not None:
+            self.cache.forget(method, url)
+
+def create_session(pool_size=10, cache=None, metrics=None, timeout=None):
+    """Creates a requests session that keeps connections alive
+
+    Each host gets its own pool of reusable connections so repeated
+    requests skip the TCP and TLS handshakes.
+
+    Parameters:
+    -----------
+    pool_size : int
+        max connections kept open per host; match the number of threads sharing the session
+    cache : ResponseCache
+        on-disk response cache; default sends every request
+    metrics : HarvestMetrics
+        records request latency; default None
+    timeout : float or tuple
+        default timeout of every request, or (connect, read); default waits forever
+
+    Returns:
+    --------
+    session : CachedSession
+        pooled session
+    """
+
+    session = CachedSession(cache, metrics, timeout)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+def create_http2_client(pool_size=10, timeout=None):
+    """Creates an httpx client that multiplexes requests over HTTP/2
+
+    Many requests to one host share a few connections instead of
+    opening one connection each. Responses are not cached.
+
+    Parameters:
+    -----------
+    pool_size : int
+        max connections kept open
+    timeout : float or tuple
+        seconds to connect and to wait for a response, or (connect, read)
+
+    Returns:
+    --------
+    client : httpx.Client
+        HTTP/2 client; None if httpx[http2] is not installed
+    """
+
+    if httpx is None:
+        print("http2 needs httpx; pip install httpx[http2]")
+        return None
+
+    try:
+        import h2 # noqa: F401 needed by httpx for http2
+    except ImportError:
+        print("http2 needs h2; pip install httpx[http2]")
+        return None
+
+    if isinstance(timeout, tuple):
+        connect_timeout, read_timeout = timeout
+        timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+
+    return httpx.Client(http2=True, limits=limits, timeout=timeout)
@@ -1,15 +1,34 @@
 from pathlib import Path
-from csapptools import librariesiolib
-from csapptools import pypilib
+from rate_limiter import RateLimiter
+from pypi_index import load_name_index, normalize_name, get_index_filepath
+from pypi_index import download_simple_index, iter_simple_index, iter_shard_index, SIMPLE_INDEX_FILE
+from http_client import create_session
+from http_cache import ResponseCache, CACHE_FILE
+from csv_journal import JournaledWriter, resume_packages
+from pypi_schema import FIELD_NAMES
+from concurrency_controller import AIMDController
+from harvest_metrics import HarvestMetrics, shard_metrics_file, METRICS_INTERVAL
+from refresh_scheduler import RefreshLog, select_stale_packages, upsert_rows
 import os
 import csv
 import time
 from datetime import datetime
 import argparse
 import textwrap
+import asyncio
+import concurrent.futures
+import itertools
+import functools
+import json
 from bs4 import BeautifulSoup
 import requests
 
+LIBRARIESIO_LIMIT = 60 # libraries.io requests per minute
+BATCH_SIZE = 59 # packages saved to file at one time
+MERGE_BATCH_SIZE = 10000 # shard rows merged into the csv file at one time
+QUEUE_REPORT_INTERVAL = 30 # seconds between async harvest queue depth prints
+TIMEOUT = 10 # seconds to connect and seconds to wait for a response
+
 def get_args():
     parser = argparse.ArgumentParser(
         description="Collect, store, and update Pypi package data in a CSV file.",
@@ -20,12 +39,31 @@ def get_args():
         py pypi_data_harvest.py --u "pypi_info_db.csv"
         py pypi_data_harvest.py -u "pypi_info_db.csv" -v
         py pypi_data_harvest.py -u "pypi_info_db.csv" -k "C:\\apikey.txt"                 
+        py pypi_data_harvest.py -u "pypi_info_db.csv" --async
+        py pypi_data_harvest.py -u "pypi_info_db.csv" --async --pypi_limit 20 --librariesio_limit 4
+        py pypi_data_harvest.py -u "pypi_info_db.csv" --async --adaptive
+        py pypi_data_harvest.py -u "pypi_info_db.csv" --no_cache
+        py pypi_data_harvest.py -u "pypi_info_db.csv" -k "C:\\apikey1.txt" "C:\\apikey2.txt" "C:\\apikey3.txt"
+        py pypi_data_harvest.py -u "pypi_info_db.csv" --refresh 500
+        py pypi_data_harvest.py -u "pypi_info_db.csv" --async --metrics "/var/lib/node_exporter/pypi_harvest.prom"
         ''')
     )
 
     parser.add_argument('-u', '--update', action='store', type=str, required=False, help="file to update")
-    parser.add_argument('-k', '--apikey', action='store', type=str, required=False, help="file path to libraries.io api key")
+    parser.add_argument('-k', '--apikey', action='store', type=str, nargs='+', required=False, help="file path to libraries.io api key; give one file per key to split the harvest across one process per key")
     parser.add_argument('--verbose', '-v', action='store_true', help="print verbose output")
+    parser.add_argument('-a', '--async', dest='async_mode', action='store_true', help="keep many packages in flight at once")
+    parser.add_argument('--pypi_limit', action='store', type=int, default=20, help="max concurrent pypi.org requests in async mode; default 20")
+    parser.add_argument('--librariesio_limit', action='store', type=int, default=4, help="max concurrent libraries.io requests in async mode; default 4")
+    parser.add_argument('--adaptive', action='store_true', help="in async mode, adapt concurrent pypi.org requests up to --pypi_limit to how pypi.org responds")
+    parser.add_argument('--parse_workers', action='store', type=int, required=False, help="processes parsing responses in async mode; default one per cpu")
+    parser.add_argument('--cache', action='store', type=str, default=CACHE_FILE, help=f"http response cache file; default {CACHE_FILE}")
+    parser.add_argument('--no_cache', action='store_true', help="send every request instead of using the response cache")
+    parser.add_argument('--simple_index', action='store', type=str, default=SIMPLE_INDEX_FILE, help=f"file the pypi simple index is saved to; default {SIMPLE_INDEX_FILE}")
+    parser.add_argument('--quota', action='store', type=int, default=LIBRARIESIO_LIMIT, help=f"libraries.io requests per minute; default {LIBRARIESIO_LIMIT}")
+    parser.add_argument('--metrics', action='store', type=str, required=False, help="write harvest metrics to this file every few seconds; Prometheus textfile format if it ends in .prom, otherwise JSON")
+    parser.add_argument('--metrics_interval', action='store', type=int, default=METRICS_INTERVAL, help=f"seconds between metrics file writes; default {METRICS_INTERVAL}")
+    parser.add_argument('--refresh', action='store', type=int, required=False, help="refresh up to this many of the stalest rows in the update file instead of collecting new projects")
 
     args = parser.parse_args() # parse arguments
 
@@ -37,132 +75,775 @@ def main():
     start_time = time.time()
     args = get_args()
     update = args['update']
-    verbose = args['verbose']
-    api_key_file =  args['apikey']
+    api_key_files = args['apikey'] or [None]
 
     # check update file is given
     if update:
         pypi_db_csv_file = update
-        # read already worked pypi projects
-        collected_packages = get_current_package_list(pypi_db_csv_file)
-    
     else:
         #date_today = datetime.now().strftime('%m-%d-%Y')
         #pypi_db_csv_file = f'{date_today}_pypi_info_db.csv' # new csv file
         pypi_db_csv_file = 'pypi_info_db.csv' # new csv file
-        collected_packages = []
+
+    if args['refresh']:
+        if not update:
+            print("--refresh needs the file to update; use -u")
+            return
+
+        refreshed_packages = refresh_rows(pypi_db_csv_file, api_key_files[0], args)
+
+        print(f"--- Completed in {time.time() - start_time} seconds ---")
+        print(f"total pypi projects refreshed: {refreshed_packages}")
+        return
+
+    # get list of pypi projects; only downloaded again when it changed
+    simple_index_file = args['simple_index']
+    download_simple_index(simple_index_file)
+
+    if len(api_key_files) > 1:
+        new_packages_collected = harvest_shards(simple_index_file, pypi_db_csv_file, api_key_files, args)
+    else:
+        # read already worked pypi projects; a resumed harvest has rows past its cursor too
+        indexed_files = [pypi_db_csv_file] if update or os.path.exists(pypi_db_csv_file) else []
+        load_packages = functools.partial(iter_simple_index, simple_index_file)
+        new_packages_collected = run_harvest(load_packages, pypi_db_csv_file, indexed_files, api_key_files[0], args)
+
+    print(f"--- Completed in {time.time() - start_time} seconds ---")
+    print(f"total new pypi projects collected: {new_packages_collected}")
+
+def run_harvest(load_packages, pypi_db_csv_file, indexed_files, api_key_file, args):
+    """collect pypi projects into a csv file with one libraries.io api key
+
+    Parameters:
+    -----------
+    load_packages : function
+        returns a new iterator over the pypi simple api projects to harvest
+    pypi_db_csv_file : str
+        csv file to save new projects to
+    indexed_files : list
+        csv files of already collected projects to skip
+    api_key_file : str
+        file path to libraries.io api key
+    args : dict
+        command line arguments
+
+    Returns:
+    --------
+    new_packages_collected : int
+        total new pypi projects collected
+    """
+
+    verbose = args['verbose']
+
+    metrics = None
+    if args['metrics']:
+        metrics = HarvestMetrics(args['metrics'], args['metrics_interval'], args.get('metrics_labels'))
+
+    # finishes any batch interrupted by a crash before the csv is read
+    writer = JournaledWriter(pypi_db_csv_file, FIELD_NAMES, metrics)
+
+    collected_packages = set()
+    for csv_file in indexed_files:
+        collected_packages |= load_name_index(csv_file)
     
     # get libraries.io api key
     api_key = get_api_key(api_key_file)
-    librariesio_obj = librariesiolib.librariesiolib(api_key)
+    rate_limiter = RateLimiter(args['quota'])
+
+    # responses saved from earlier runs
+    cache = None
+    if not args['no_cache']:
+        cache = ResponseCache(args['cache'])
+
+    # pooled keep-alive connections to pypi.org and libraries.io; a hung request times out
+    # instead of holding a worker, and counts as throttled for the adaptive pypi.org limit
+    session = create_session(args['pypi_limit'] + args['librariesio_limit'], cache, metrics, (TIMEOUT, TIMEOUT))
+
+    if metrics:
+        metrics.watch_rate_limiter(rate_limiter)
+        metrics.start()
+
+    # continue after the last package saved if a harvest was stopped
+    pypi_packages = resume_packages(load_packages, writer.read_cursor())
+
+    if args['async_mode']:
+        async_harvest = AsyncHarvest(session, api_key, rate_limiter, writer, args['pypi_limit'], args['librariesio_limit'], args['parse_workers'], verbose, args['adaptive'])
+        if metrics:
+            metrics.watch_queues(async_harvest.queue_depths)
+        new_packages_collected = asyncio.run(async_harvest.run(pypi_packages, collected_packages))
+        failed_packages = async_harvest.failed_packages
+    else:
+        new_packages_collected, failed_packages = harvest(pypi_packages, collected_packages, session, api_key, rate_limiter, writer, verbose)
+
+    if failed_packages:
+        # the cursor stays before the first failed package
+        print(f"{failed_packages} projects failed; run the harvest again to retry them")
+    else:
+        writer.finish() # every package worked.. nothing to resume
+
+    if metrics:
+        metrics.stop()
+
+    print(f"libraries.io {rate_limiter.report()}")
+    if cache:
+        print(f"response cache {cache.report()}")
+        cache.close()
+
+    return new_packages_collected
+
+def refresh_rows(pypi_db_csv_file, api_key_file, args):
+    """collect the stalest projects again and replace their rows in the csv file
+
+    Rows are picked by time since they were last collected, weighted
+    up for projects with a recent release, so the libraries.io quota
+    goes to the rows most likely to have changed.
+
+    Parameters:
+    -----------
+    pypi_db_csv_file : str
+        csv file of collected projects
+    api_key_file : str
+        file path to libraries.io api key
+    args : dict
+        command line arguments
+
+    Returns:
+    --------
+    refreshed_packages : int
+        total rows replaced
+    """
+
+    # finishes any batch interrupted by a crash before the csv is read
+    JournaledWriter(pypi_db_csv_file, FIELD_NAMES)
+
+    refresh_log = RefreshLog(pypi_db_csv_file)
+    package_names = select_stale_packages(pypi_db_csv_file, refresh_log, args['refresh'])
+    print(f"refreshing {len(package_names)} stalest projects")
+
+    api_key = get_api_key(api_key_file)
+    rate_limiter = RateLimiter(args['quota'])
+
+    cache = None
+    if not args['no_cache']:
+        cache = ResponseCache(args['cache'])
+
+    session = create_session(cache=cache, timeout=(TIMEOUT, TIMEOUT))
+
+    refreshed_rows = {} # normalized name: new row
+    failed_packages = set() # not marked, so the next run picks them again
+    for package_name in package_names:
+        # gone from pypi or libraries.io.. keep the old row
+        try:
+            package_exists, metadata_dict = probe_pypi_package(package_name, session)
+        except requests.exceptions.RequestException as exc:
+            print(f"failed project: {package_name}; reason: {type(exc).__name__}: {exc}")
+            failed_packages.add(package_name)
+            continue
+
+        if not package_exists:
+            print(f"skipping project: {package_name}")
+            continue
+
+        print(f"refreshing project: {package_name}")
+        package_info_json = get_librariesio_package(api_key, package_name, rate_limiter, session)
+        if package_info_json == None:
+            print(f"skipping project: {package_name}")
+            continue
+
+        refreshed_rows[normalize_name(package_name)] = enrich_package_info(package_info_json, metadata_dict)
+
+    refreshed_packages = upsert_rows(pypi_db_csv_file, FIELD_NAMES, refreshed_rows)
+    print(f"file saved: {pypi_db_csv_file}")
+
+    # skipped projects are marked too so they don't use the next run's budget
+    refresh_log.mark([package_name for package_name in package_names if package_name not in failed_packages], time.time())
+    refresh_log.close()
+
+    print(f"libraries.io {rate_limiter.report()}")
+    if cache:
+        print(f"response cache {cache.report()}")
+        cache.close()
+
+    return refreshed_packages
+
+def harvest_shards(simple_index_file, pypi_db_csv_file, api_key_files, args):
+    """split the harvest across one process per libraries.io api key
+
+    Packages are assigned to shards by a hash of their normalized name,
+    so a package always lands in the same shard. Each shard reads its
+    packages from the saved simple index and saves to its own csv file,
+    which is merged into the csv file once every shard is done. The
+    file of a shard that failed is kept out of the merge, so the next
+    run resumes it.
+
+    Parameters:
+    -----------
+    simple_index_file : str
+        file saved by download_simple_index
+    pypi_db_csv_file : str
+        csv file to save new projects to
+    api_key_files : list
+        file paths to libraries.io api keys; one shard per key
+    args : dict
+        command line arguments
+
+    Returns:
+    --------
+    new_packages_collected : int
+        total new pypi projects merged into the csv file
+    """
+
+    shards = len(api_key_files)
+
+    # a resumed harvest has rows in the csv file even without -u
+    index_csv_file = args['update'] or os.path.exists(pypi_db_csv_file)
+
+    # make sure the name index is current before the shards read it
+    if index_csv_file:
+        load_name_index(pypi_db_csv_file)
+
+    shard_files = [f"{pypi_db_csv_file}.shard{shard}" for shard in range(shards)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=shards) as executor:
+        futures = {}
+        for shard in range(shards):
+            indexed_files = [pypi_db_csv_file, shard_files[shard]] if index_csv_file else [shard_files[shard]]
+            load_packages = functools.partial(iter_shard_index, simple_index_file, shard, shards)
+            shard_args = dict(args)
+            if args['metrics']:
+                # one metrics file per shard, told apart by a shard label
+                shard_args['metrics'] = shard_metrics_file(args['metrics'], shard)
+                shard_args['metrics_labels'] = {'shard': str(shard)}
+            future = executor.submit(run_harvest, load_packages, shard_files[shard], indexed_files, api_key_files[shard], shard_args)
+            futures[future] = shard
+
+        failed_shards = set()
+        for future in concurrent.futures.as_completed(futures):
+            shard = futures[future]
+            try:
+                print(f"shard {shard} collected {future.result()} new pypi projects")
+            except Exception as exc:
+                print(f"shard {shard} failed; reason: {type(exc).__name__}: {exc}")
+                print(f"kept {shard_files[shard]} for the next run")
+                failed_shards.add(shard)
+
+    return merge_shards(pypi_db_csv_file, [shard_files[shard] for shard in range(shards) if shard not in failed_shards])
 
-    # get list of pypi projects
-    pypilib_obj = pypilib.pypilib()
-    pypi_packages_list = pypilib_obj.get_simple()
+def read_shard_rows(shard_file):
+    """read a shard's rows one at a time"""
+
+    # finishes any batch interrupted by a crash before the shard is read
+    JournaledWriter(shard_file, FIELD_NAMES)
+
+    if not os.path.exists(shard_file):
+        return
+
+    with open(shard_file, 'r', encoding='utf-8', newline='') as csv_file:
+        yield from csv.DictReader(csv_file)
+
+def merge_shards(pypi_db_csv_file, shard_files):
+    """merge shard csv files into the csv file in shard order
+
+    Rows are streamed from one shard file after the other, so the merge
+    doesn't hold the data set in memory. Rows already in the csv file
+    are skipped, so an interrupted merge can run again. Shard files are
+    removed once merged.
+
+    Parameters:
+    -----------
+    pypi_db_csv_file : str
+        csv file to save new projects to
+    shard_files : list
+        shard csv files
+
+    Returns:
+    --------
+    merged_rows : int
+        total rows added to the csv file
+    """
+
+    writer = JournaledWriter(pypi_db_csv_file, FIELD_NAMES)
+    collected_packages = load_name_index(pypi_db_csv_file)
+
+    merged_rows = 0
+    batch = []
+    for row in itertools.chain.from_iterable(read_shard_rows(shard_file) for shard_file in shard_files):
+        package_name = normalize_name(row['name'])
+        if package_name in collected_packages:
+            continue
+        collected_packages.add(package_name)
+
+        batch.append(row)
+        merged_rows += 1
+        if len(batch) == MERGE_BATCH_SIZE:
+            writer.commit(batch, None)
+            batch = []
+
+    if batch:
+        writer.commit(batch, None)
+    writer.finish()
+
+    for shard_file in shard_files:
+        for file_name in (shard_file, get_index_filepath(shard_file)):
+            if os.path.exists(file_name):
+                os.remove(file_name)
+
+    return merged_rows
+
+def harvest(pypi_packages, collected_packages, session, api_key, rate_limiter, writer, verbose):
+    """collect new pypi projects one package at a time
+
+    A package whose pypi.org request fails, e.g. on a 429 or 5xx, is
+    not saved and holds the cursor before it, so the next run tries it
+    again; the packages after it are still collected.
+
+    Parameters:
+    -----------
+    pypi_packages : iterator
+        (position, pypi_package) tuples from resume_packages
+    collected_packages : set
+        normalized pypi project names already in the data set
+    session : CachedSession
+        pooled session for pypi.org and libraries.io
+    api_key : str
+        libraries.io api key
+    rate_limiter : RateLimiter
+        keeps libraries.io requests at the api quota
+    writer : JournaledWriter
+        saves batches of new projects and the resume cursor
+    verbose : bool
+        print verbose output
+
+    Returns:
+    --------
+    new_packages_collected : int
+        total new pypi projects collected
+    failed_packages : int
+        total pypi projects that failed
+    """
 
-    api_count = 1
     new_packages_collected = 0
+    failed_packages = 0
 
     librarisio_packages_info = [] # package data to out file
+    cursor = None # last package worked, up to the first failed package
     
-    limit = 60
-    for pypi_package in pypi_packages_list:
+    for position, pypi_package in pypi_packages:
+        last_cursor = cursor
+        if not failed_packages:
+            cursor = {'position': position, 'name': pypi_package['name']}
         
         # eval if we have already collected the package before making a request
-        if pypi_package['name'] in collected_packages:
+        if normalize_name(pypi_package['name']) in collected_packages:
             if verbose:
                 print(f"already collected: {pypi_package['name']}")
             continue # already collected.. skip package
         
-        package_exists = valid_pypi_package(pypi_package['name'])
+        # check the package exists and get additional metadata from pypi
+        try:
+            package_exists, metadata_dict = probe_pypi_package(pypi_package['name'], session)
+        except requests.exceptions.RequestException as exc:
+            print(f"failed project: {pypi_package['name']}; reason: {type(exc).__name__}: {exc}")
+            failed_packages += 1
+            cursor = last_cursor # never moves past it
+            continue
         
         if package_exists:
             print(f"working project: {pypi_package['name']}")
-            package_info_json, failure = librariesio_obj.get_pypi_package(pypi_package['name'])
-
-            # handle request failures
-            while failure:
-                if failure == 'json':
-                    #one_hour_failures += 1
-                    print("libraries.io connection error.. sleeping for one hour..")
-                    time.sleep(3600)
-                    print(f"trying package {pypi_package['name']} again...")
-                    package_info_json, failure = librariesio_obj.get_pypi_package(pypi_package['name'])
-                else:
-                    print("sleeping for 60 seconds...")
-                    time.sleep(60)
-                    package_info_json, failure = librariesio_obj.get_pypi_package(pypi_package['name'])
+            package_info_json = get_librariesio_package(api_key, pypi_package['name'], rate_limiter, session)
 
-            if package_info_json == None and failure == False:
+            if package_info_json == None:
                 print(f"skipping project: {pypi_package['name']}")
                 continue
 
-            # enrich data collected
-            #######################
-            # add field total_versions
-            package_info_json['total_versions'] = {}
-            try:
-                package_info_json['total_versions'] = len(package_info_json['versions'])
-            except:
-                package_info_json['total_versions'] = 0
-            
-            # limit 'licenses' field to 120 characters
-            if package_info_json['licenses']:
-                if len(package_info_json['licenses']) > 120:
-                    package_info_json['licenses'] = package_info_json['licenses'][:120]
-
-            # remove 'versions' field
-            del package_info_json['versions']
-
-            # remove 'contributions_count' field
-            # this field was recently added to libraries.io
-            del package_info_json['contributions_count']
-            
-            # pypi data enrichment
-            #######################
-            # get additional metadata from pypi
-            metadata_dict = get_pypi_metadata(pypi_package['name'])
-
-            # add maintainers
-            maintainers = metadata_dict['maintainers']
-            maintainers = str(maintainers).replace('[','')
-            maintainers = str(maintainers).replace(']','')
-            package_info_json['maintainers'] = {}
-            package_info_json['maintainers'] = maintainers
-
-            # add latest_upload_date and latest_upload_time
-            upload_date, upload_time = format_date_time(package_info_json['latest_release_published_at'])
-            package_info_json['latest_upload_date'] = {}
-            package_info_json['latest_upload_time'] = {}
-            package_info_json['latest_upload_date'] = upload_date
-            package_info_json['latest_upload_time'] = upload_time
-
-            # add first_upload_date
-            first_upload_date = metadata_dict['first_upload_date']
-            package_info_json['first_upload_date'] = {}
-            package_info_json['first_upload_date'] = first_upload_date
+            package_info_json = enrich_package_info(package_info_json, metadata_dict)
 
             # add package data 
             librarisio_packages_info.append(package_info_json)
-            api_count += 1
             new_packages_collected += 1
 
             # save data collected
-            if api_count == limit:
-                out_csv_file(librarisio_packages_info, pypi_db_csv_file) # save each batch to file
+            if len(librarisio_packages_info) == BATCH_SIZE:
+                writer.commit(librarisio_packages_info, cursor) # save each batch to file
                 librarisio_packages_info = [] # reset list
-                api_count = 1 # reset request count
-                
-                print("api count limit")
-                print("sleeping for 60 seconds...")
-                time.sleep(60)
     
     # save remaining data collected
     if librarisio_packages_info:
-        out_csv_file(librarisio_packages_info, pypi_db_csv_file)
+        writer.commit(librarisio_packages_info, cursor)
 
-    print(f"--- Completed in {time.time() - start_time} seconds ---")
-    print(f"total new pypi projects collected: {new_packages_collected}")
+    return new_packages_collected, failed_packages
+
+class AsyncHarvest:
+    """collect new pypi projects through a pipeline of bounded queues
+
+    Each package moves through three stages, each fed by its own queue:
+    fetch downloads the pypi and libraries.io responses with blocking
+    requests in a thread pool, parse decodes and enriches them in a
+    process pool so parsing is not held up by the GIL, and write saves
+    the rows in the same batches and format as the sequential harvest.
+    The resume cursor only moves past a package once every package
+    before it is finished, since packages finish out of order. A package
+    that fails, e.g. on a 429 or 5xx from pypi.org, is not saved and
+    holds the cursor before it, so the next run tries it again.
+
+    Parameters:
+    -----------
+    session : CachedSession
+        pooled session for pypi.org and libraries.io
+    api_key : str
+        libraries.io api key
+    rate_limiter : RateLimiter
+        keeps libraries.io requests at the api quota
+    writer : JournaledWriter
+        saves batches of new projects and the resume cursor
+    pypi_limit : int
+        max concurrent pypi.org requests
+    librariesio_limit : int
+        max concurrent libraries.io requests
+    parse_workers : int
+        processes parsing responses; default one per cpu
+    verbose : bool
+        print verbose output
+    adaptive : bool
+        adapt concurrent pypi.org requests between 1 and pypi_limit
+    """
+
+    def __init__(self, session, api_key, rate_limiter, writer, pypi_limit=20, librariesio_limit=4, parse_workers=None, verbose=False, adaptive=False):
+        self.session = session
+        self.api_key = api_key
+        self.rate_limiter = rate_limiter
+        self.writer = writer
+        self.pypi_limit = pypi_limit
+        self.librariesio_limit = librariesio_limit
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.verbose = verbose
+        self.adaptive = adaptive
+
+        self.new_packages_collected = 0
+        self.failed_packages = 0
+        self.librarisio_packages_info = [] # package data to out file
+        self.in_flight = {} # position: name; in the order queued
+        self.cursor = None # last package worked
+
+        self.fetch_queue = None
+        self.parse_queue = None
+        self.write_queue = None
+
+    async def run(self, pypi_packages, collected_packages):
+        """harvest every pypi project not already collected
+
+        Parameters:
+        -----------
+        pypi_packages : iterator
+            (position, pypi_package) tuples from resume_packages
+        collected_packages : set
+            normalized pypi project names already in the data set
+
+        Returns:
+        --------
+        new_packages_collected : int
+            total new pypi projects collected
+        """
+
+        fetch_workers = self.pypi_limit + self.librariesio_limit
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=fetch_workers + 1))
+
+        if self.adaptive:
+            self.pypi_controller = AIMDController('pypi.org', max(1, self.pypi_limit // 4), 1, self.pypi_limit)
+        else:
+            self.pypi_controller = AIMDController('pypi.org', self.pypi_limit, self.pypi_limit, self.pypi_limit)
+        self.librariesio_semaphore = asyncio.Semaphore(self.librariesio_limit)
+
+        self.fetch_queue = asyncio.Queue(maxsize=fetch_workers * 2) # positions to download
+        self.parse_queue = asyncio.Queue(maxsize=self.parse_workers * 2) # downloaded responses
+        self.write_queue = asyncio.Queue(maxsize=BATCH_SIZE * 2) # finished packages
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.parse_workers) as parse_pool:
+            self.parse_pool = parse_pool
+
+            tasks = [asyncio.create_task(self.fetch_stage()) for _ in range(fetch_workers)]
+            tasks += [asyncio.create_task(self.parse_stage()) for _ in range(self.parse_workers)]
+            tasks.append(asyncio.create_task(self.write_stage()))
+            tasks.append(asyncio.create_task(self.report_queues()))
+            feed = asyncio.create_task(self.feed(pypi_packages, collected_packages))
+
+            # the stages only stop on their own by failing, e.g. a batch that can't be saved;
+            # stop the harvest then instead of waiting on a queue nobody empties
+            done, pending = await asyncio.wait([feed, *tasks], return_when=asyncio.FIRST_COMPLETED)
+            for task in [feed, *tasks]:
+                task.cancel()
+            await asyncio.gather(feed, *tasks, return_exceptions=True)
+            for task in done:
+                task.result() # raises the exception the stage failed with
+
+        # save remaining data collected
+        if self.librarisio_packages_info:
+            self.writer.commit(self.librarisio_packages_info, self.cursor)
+            self.librarisio_packages_info = []
+
+        if self.adaptive:
+            print(f"pypi.org {self.pypi_controller.report()}")
+
+        return self.new_packages_collected
+
+    async def feed(self, pypi_packages, collected_packages):
+        """queue every package not already collected, then wait for the stages to finish them"""
+
+        for position, pypi_package in pypi_packages:
+            # eval if we have already collected the package before making a request
+            if normalize_name(pypi_package['name']) in collected_packages:
+                if self.verbose:
+                    print(f"already collected: {pypi_package['name']}")
+                if not self.in_flight:
+                    self.cursor = {'position': position, 'name': pypi_package['name']}
+                continue # already collected.. skip package
+
+            self.in_flight[position] = pypi_package['name']
+            await self.fetch_queue.put(position)
+
+        # each stage hands its packages to the next before marking them done
+        await self.fetch_queue.join()
+        await self.parse_queue.join()
+        await self.write_queue.join()
+
+    def queue_depths(self):
+        """Returns the packages waiting in front of each stage"""
+
+        if self.fetch_queue is None:
+            return {}
+
+        return {'fetch': self.fetch_queue.qsize(),
+                'parse': self.parse_queue.qsize(),
+                'write': self.write_queue.qsize()}
+
+    async def report_queues(self):
+        """print the queue depths until cancelled
+
+        A full queue is waiting on the stage after it; an empty
+        queue means the stage before it is the bottleneck.
+        """
+
+        while True:
+            await asyncio.sleep(QUEUE_REPORT_INTERVAL)
+            depths = self.queue_depths()
+            print(f"queue depth: fetch {depths['fetch']}/{self.fetch_queue.maxsize}, "
+                  f"parse {depths['parse']}/{self.parse_queue.maxsize}, "
+                  f"write {depths['write']}/{self.write_queue.maxsize}")
+
+    async def fetch_stage(self):
+        """download the pypi and libraries.io responses of queued packages until cancelled"""
+
+        while True:
+            position = await self.fetch_queue.get()
+            package_name = self.in_flight[position]
+            try:
+                responses = await self.fetch_package(package_name)
+                if responses == None:
+                    await self.write_queue.put((position, None, False))
+                else:
+                    await self.parse_queue.put((position, *responses))
+            except Exception as exc:
+                print(f"failed project: {package_name}; reason: {type(exc).__name__}: {exc}")
+                await self.write_queue.put((position, None, True))
+            finally:
+                self.fetch_queue.task_done()
+
+    async def fetch_package(self, package_name):
+        """run one package through the pypi and libraries.io requests
+
+        Returns:
+        --------
+        responses : tuple
+            pypi JSON api body and libraries.io api response; None if the package is skipped
+        """
+
+        async with self.pypi_controller.slot() as slot:
+            pypi_body = await asyncio.to_thread(get_pypi_json, package_name, self.session, slot)
+
+        if pypi_body == None:
+            return None
+
+        print(f"working project: {package_name}")
+        async with self.librariesio_semaphore:
+            package_info_json = await asyncio.to_thread(get_librariesio_package, self.api_key, package_name, self.rate_limiter, self.session)
+
+        if package_info_json == None:
+            print(f"skipping project: {package_name}")
+            return None
+
+        return pypi_body, package_info_json
+
+    async def parse_stage(self):
+        """parse and enrich downloaded packages in the process pool until cancelled"""
+
+        loop = asyncio.get_running_loop()
+        while True:
+            position, pypi_body, package_info_json = await self.parse_queue.get()
+            package_name = self.in_flight[position]
+            package_row = None
+            failed = False
+            try:
+                package_row = await loop.run_in_executor(self.parse_pool, build_package_row, package_info_json, pypi_body)
+
+                if package_row == None:
+                    # fields missing from the JSON api.. read the project page
+                    async with self.pypi_controller.slot() as slot:
+                        pypi_html = await asyncio.to_thread(get_pypi_html, package_name, self.session, slot)
+                    package_row = await loop.run_in_executor(self.parse_pool, build_package_row, package_info_json, pypi_body, pypi_html)
+            except Exception as exc:
+                print(f"failed project: {package_name}; reason: {type(exc).__name__}: {exc}")
+                failed = True
+            finally:
+                await self.write_queue.put((position, package_row, failed))
+                self.parse_queue.task_done()
+
+    async def write_stage(self):
+        """collect finished packages and save each full batch to file until cancelled"""
+
+        while True:
+            position, package_row, failed = await self.write_queue.get()
+            try:
+                if failed:
+                    # left in flight so the cursor never moves past it
+                    self.failed_packages += 1
+                else:
+                    if package_row != None:
+                        self.librarisio_packages_info.append(package_row)
+                        self.new_packages_collected += 1
+
+                    # every package before the oldest one in flight is finished
+                    oldest_position = next(iter(self.in_flight))
+                    package_name = self.in_flight.pop(position)
+                    if position == oldest_position:
+                        self.cursor = {'position': position, 'name': package_name}
+
+                if len(self.librarisio_packages_info) >= BATCH_SIZE:
+                    batch = self.librarisio_packages_info
+                    self.librarisio_packages_info = [] # reset list
+                    await asyncio.to_thread(self.writer.commit, batch, self.cursor) # save each batch to file
+            finally:
+                self.write_queue.task_done()
+
+def get_librariesio_package(api_key, package_name, rate_limiter, session):
+    """get package data from libraries.io and retry api failures
+
+    Requests wait on the rate limiter to stay at the api quota;
+    fresh responses from the session's cache skip the quota.
+    Throttled or failed requests are retried after the server's
+    Retry-After hint or a jittered exponential backoff.
+
+    Parameters:
+    -----------
+    api_key : str
+        libraries.io api key
+    package_name : str
+        pypi package name
+    rate_limiter : RateLimiter
+        keeps libraries.io requests at the api quota
+    session : CachedSession
+        pooled session
+
+    Returns:
+    --------
+    package_info_json : dict
+        libraries.io api response; None if libraries.io does not know the package
+    """
+
+    url = f"https://libraries.io/api/pypi/{package_name}?api_key={api_key}"
+
+    attempt = 0
+    while True:
+        # cached responses don't count against the api quota
+        response = session.cached(url)
+        if response is None:
+            rate_limiter.acquire()
+            try:
+                with rate_limiter.working():
+                    response = session.get(url)
+            except requests.exceptions.RequestException as exc:
+                print(f"libraries.io connection error: {type(exc).__name__}")
+                rate_limiter.backoff(attempt)
+                attempt += 1
+                continue
+
+        if response.status_code == 404:
+            print(f"failed to get {package_name}; reason: {response.reason}")
+            return None
+
+        if response.status_code == 429 or response.status_code >= 500:
+            print(f"failed to get {package_name}; reason: {response.reason}")
+            delay = rate_limiter.backoff(attempt, response.headers.get('Retry-After'))
+            print(f"retried {package_name} after {delay:.1f} seconds")
+            attempt += 1
+            continue
+
+        try:
+            return response.json()
+        except requests.exceptions.JSONDecodeError:
+            print("libraries.io connection error.. bad json response")
+            session.forget(url)
+            rate_limiter.backoff(attempt)
+            attempt += 1
+
+def enrich_package_info(package_info_json, metadata_dict):
+    """add pypi metadata and derived fields to libraries.io package data
+
+    Parameters:
+    -----------
+    package_info_json : dict
+        libraries.io api response
+    metadata_dict : dict
+        pypi metadata from probe_pypi_package
+
+    Returns:
+    --------
+    package_info_json : dict
+        csv row for JournaledWriter.commit
+    """
+
+    # enrich data collected
+    #######################
+    # add field total_versions
+    package_info_json['total_versions'] = {}
+    try:
+        package_info_json['total_versions'] = len(package_info_json['versions'])
+    except:
+        package_info_json['total_versions'] = 0
+    
+    # limit 'licenses' field to 120 characters
+    if package_info_json['licenses']:
+        if len(package_info_json['licenses']) > 120:
+            package_info_json['licenses'] = package_info_json['licenses'][:120]
+
+    # remove 'versions' field
+    del package_info_json['versions']
+
+    # remove 'contributions_count' field
+    # this field was recently added to libraries.io
+    del package_info_json['contributions_count']
+    
+    # pypi data enrichment
+    #######################
+    # add maintainers
+    maintainers = metadata_dict['maintainers']
+    maintainers = str(maintainers).replace('[','')
+    maintainers = str(maintainers).replace(']','')
+    package_info_json['maintainers'] = {}
+    package_info_json['maintainers'] = maintainers
+
+    # add latest_upload_date and latest_upload_time
+    upload_date, upload_time = format_date_time(package_info_json['latest_release_published_at'])
+    package_info_json['latest_upload_date'] = {}
+    package_info_json['latest_upload_time'] = {}
+    package_info_json['latest_upload_date'] = upload_date
+    package_info_json['latest_upload_time'] = upload_time
+
+    # add first_upload_date
+    first_upload_date = metadata_dict['first_upload_date']
+    package_info_json['first_upload_date'] = {}
+    package_info_json['first_upload_date'] = first_upload_date
+
+    return package_info_json
 
 def get_api_key(api_key_file):
     """read in libraries.io api key
@@ -184,98 +865,258 @@ def get_api_key(api_key_file):
     
     return api_key
 
-def get_current_package_list(csv_filepath):
-    """read already collected pypi project names
+def probe_pypi_package(package_name, session=requests):
+    """Perform one GET request to check the package exists and read its metadata
+
+    pypi's simple api commonly returns
+    packages that no longer exist.
+
+    Reads pypi's JSON api; the html project page is only
+    downloaded when a field is missing from the JSON response.
 
     Parameters:
     -----------
-    csv_filepath : str
-        pypi data csv file path
-
+    package_name : str
+        pypi package name
+    session : requests.Session
+        pooled session; default sends a one-off request
+    
     Returns:
     --------
-    packages : list
-        pypi project names
+    package_exists : bool
+        True : package exists on pypi
+    metadata : dict
+        maintainers and first_upload_date; None if the package does not exist
+
+    Raises:
+    -------
+    requests.exceptions.HTTPError
+        pypi.org answered anything but 200 or 404; the package is neither saved nor skipped
     """
-    
-    with open(csv_filepath, encoding="utf-8") as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        next(csv_reader) # skip headers
-        
-        packages = []
-        for row in csv_reader:
-            package_name = row[15]
-            packages.append(package_name)
-        
-    return packages
 
-def valid_pypi_package(package_name):
-    """Perform HEAD request to ensure package exists
+    pypi_body = get_pypi_json(package_name, session)
+    if pypi_body == None:
+        return False, None
 
-    pypi's simple api commonly returns
-    packages that no longer exist.
+    metadata = parse_pypi_body(pypi_body)
+    if metadata['maintainers'] is None or metadata['first_upload_date'] is None:
+        fill_pypi_metadata(metadata, get_pypi_html(package_name, session))
+
+    return True, metadata
+
+def get_pypi_json(package_name, session=requests, slot=None):
+    """download a package from pypi's JSON api
 
     Parameters:
     -----------
     package_name : str
         pypi package name
+    session : requests.Session
+        pooled session; default sends a one-off request
+    slot : Slot
+        AIMDController slot told about throttled responses; default None
+
+    Returns:
+    --------
+    pypi_body : bytes
+        response body; None if the package does not exist
+
+    Raises:
+    -------
+    requests.exceptions.HTTPError
+        pypi.org answered anything but 200 or 404, e.g. 429 or 5xx, which says nothing about the package
+    """
+
+    url = f"https://pypi.org/pypi/{package_name}/json"
+    response = session.get(url)
+    if slot is not None:
+        slot.check_status(response.status_code)
+
+    if response.status_code == 404:
+        return None
+
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(f"{response.status_code} response from {url}")
+
+    return response.content
+
+def parse_pypi_body(pypi_body):
+    """decode a pypi JSON api response and extract its metadata
+
+    Returns:
+    --------
+    metadata : dict
+        maintainers and first_upload_date; None for each field missing
+    """
+
+    try:
+        return parse_pypi_json(json.loads(pypi_body))
+    except ValueError:
+        return {'maintainers': None, 'first_upload_date': None}
+
+def fill_pypi_metadata(metadata, pypi_html):
+    """fill fields missing from pypi's JSON api from the html project page
+
+    Parameters:
+    -----------
+    metadata : dict
+        from parse_pypi_body; updated in place
+    pypi_html : str
+        project page from get_pypi_html; '' if the page was not found
+    """
+
+    if pypi_html:
+        html_metadata = parse_pypi_metadata(pypi_html)
+    else:
+        html_metadata = {'maintainers': 'none', 'first_upload_date': 'none'}
+
+    for field, value in html_metadata.items():
+        if metadata[field] is None:
+            metadata[field] = value
+
+def build_package_row(package_info_json, pypi_body, pypi_html=None):
+    """parse pypi's response and enrich the libraries.io package data with it
+
+    Runs in the async harvest's process pool, so it only takes
+    and returns picklable data.
+
+    Parameters:
+    -----------
+    package_info_json : dict
+        libraries.io api response
+    pypi_body : bytes
+        pypi JSON api response from get_pypi_json
+    pypi_html : str
+        project page from get_pypi_html; default None when not downloaded yet
+
+    Returns:
+    --------
+    package_info_json : dict
+        csv row for JournaledWriter.commit; None if the project page is needed for missing fields
+    """
+
+    metadata = parse_pypi_body(pypi_body)
+    if metadata['maintainers'] is None or metadata['first_upload_date'] is None:
+        if pypi_html is None:
+            return None
+        fill_pypi_metadata(metadata, pypi_html)
+
+    return enrich_package_info(package_info_json, metadata)
+
+def parse_pypi_json(package_json):
+    """extract metadata from pypi's JSON api response
+
+    Parameters:
+    -----------
+    package_json : dict
+        https://pypi.org/pypi/{package_name}/json response
     
     Returns:
     --------
-    package_exists : bool
-        True : package exists on pypi
+    metadata : dict
+        maintainers : list
+            contains strings of names; None if missing
+        first_upload_date : str
+            yyyy-mm-dd; None if missing
     """
 
-    package_exists = True
+    # extract all maintainers
+    maintainers = None
+    ownership = package_json.get('ownership') or {}
+    roles = ownership.get('roles') or []
+    if roles:
+        maintainers = []
+        for role in roles:
+            username = role['user']
+            if not username in maintainers:
+                maintainers.append(username)
 
-    url = f"https://pypi.org/project/{package_name}/"
-    response = requests.head(url)
+    # extract first upload date
+    upload_times = [release_file['upload_time']
+                    for release_files in (package_json.get('releases') or {}).values()
+                    for release_file in release_files
+                    if release_file.get('upload_time')]
 
-    if response.status_code == 404:
-        package_exists = False
+    first_upload_date = None
+    if upload_times:
+        first_upload_date = min(upload_times).split('T')[0] # 2023-07-26T04:40:48
 
-    return package_exists
+    metadata = {'maintainers': maintainers, 'first_upload_date': first_upload_date}
 
-def get_pypi_metadata(package_name):
-    """extract metadata from pypi package url html response
+    return metadata
+
+def get_pypi_html(package_name, session=requests, slot=None):
+    """download a pypi project page
 
     Parameters:
     -----------
     package_name : str
         package name
+    session : requests.Session
+        pooled session; default sends a one-off request
+    slot : Slot
+        AIMDController slot told about throttled responses; default None
     
     Returns:
     --------
-    maintainers : list
-        contains strings of names
+    html : str
+        project page; '' if the page was not found
+
+    Raises:
+    -------
+    requests.exceptions.HTTPError
+        pypi.org answered anything but 200 or 404, e.g. 429 or 5xx, which says nothing about the package
     """
 
     package_url = f"https://pypi.org/project/{package_name}/"
+    response = session.get(package_url)
+    if slot is not None:
+        slot.check_status(response.status_code)
+
+    if response.status_code == 404:
+        print(f"package not found {package_url}")
+        return ''
+
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(f"{response.status_code} response from {package_url}")
+
+    return response.text
+
+def parse_pypi_metadata(html):
+    """extract metadata from pypi package url html response
+
+    Parameters:
+    -----------
+    html : str
+        pypi project page
     
-    response = requests.get(package_url)
+    Returns:
+    --------
+    metadata : dict
+        maintainers : list
+            contains strings of names
+        first_upload_date : str
+            yyyy-mm-dd; 'none' if the page lists no releases
+    """
 
-    maintainers = []
-    if not response.status_code == 404:
-        soup = BeautifulSoup(response.text, 'lxml')
+    soup = BeautifulSoup(html, 'lxml')
 
-        # extract all maintiners
-        maintainer_usernames = soup.find_all("span", class_="sidebar-section__user-gravatar-text")
-        for maintainer in maintainer_usernames:
-            username = maintainer.text.strip()
-            if not username in maintainers:
-                maintainers.append(username)
+    # extract all maintiners
+    maintainers = []
+    maintainer_usernames = soup.find_all("span", class_="sidebar-section__user-gravatar-text")
+    for maintainer in maintainer_usernames:
+        username = maintainer.text.strip()
+        if not username in maintainers:
+            maintainers.append(username)
 
-        # extract first upload date
-        version_dates = soup.find_all("p", class_="release__version-date")
+    # extract first upload date
+    first_upload_date = 'none'
+    version_dates = soup.find_all("p", class_="release__version-date")
+    if version_dates:
         first_release_date = version_dates[-1].text.strip()
         first_release_date_dt = datetime.strptime(first_release_date, '%b %d, %Y')
         first_upload_date = first_release_date_dt.strftime('%Y-%m-%d')
 
-    else:
-        print(f"package not found {package_url}")
-        maintainers = 'none'
-        first_upload_date = 'none'
-
     metadata = {'maintainers': maintainers, 'first_upload_date': first_upload_date}
 
     return metadata
@@ -302,60 +1143,5 @@ def format_date_time(date_time):
 
     return date, time
 
-def out_csv_file(data, csv_file):
-    """save pypi data to csv file
-
-    Parameters:
-    -----------
-    data : dict
-        csv rows
-    csv_file : str
-        csv file
-    """
-
-    file_name = csv_file
-    field_names = ['dependent_repos_count', 
-                   'dependents_count', 
-                   'deprecation_reason',
-                   'description',
-                   'forks',
-                   'homepage',
-                   'keywords',
-                   'language',
-                   'latest_download_url',
-                   'latest_release_number',
-                   'latest_release_published_at',
-                   'latest_stable_release_number',
-                   'latest_stable_release_published_at',
-                   'license_normalized',
-                   'licenses',
-                   'name',
-                   'normalized_licenses',
-                   'package_manager_url',
-                   'platform',
-                   'rank',
-                   'repository_license',
-                   'repository_status',
-                   'repository_url',
-                   'stars',
-                   'status',
-                   'total_versions',
-                   'maintainers',
-                   'latest_upload_date',
-                   'latest_upload_time',
-                   'first_upload_date']
-    
-    file_exists = os.path.isfile(file_name)
-
-    with open(file_name, 'a', encoding='utf-8', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=field_names)
-        
-        if not file_exists:
-            writer.writeheader()
-        
-        writer.writerows(data)
-
-    print(f"file saved: {file_name}")
-
 if __name__ == "__main__":
     main()
\ No newline at end of file
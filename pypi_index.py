@@ -0,0 +1,305 @@
+import csv
+import hashlib
+import html
+import io
+import json
+import os
+import re
+import zlib
+import requests
+
+NAME_COLUMN = 15 # 'name' column in the pypi data csv file
+INDEX_VERSION = 1
+
+SIMPLE_URL = "https://pypi.org/simple/" # contains a list of every project on pypi.org
+SIMPLE_JSON = 'application/vnd.pypi.simple.v1+json' # PEP 691
+SIMPLE_INDEX_FILE = 'pypi_simple_index'
+CHUNK_SIZE = 1024 * 1024
+
+def normalize_name(name):
+    """Normalizes a project name per PEP 503
+
+    Parameters:
+    -----------
+    name : str
+        pypi project name
+
+    Returns:
+    --------
+    normalized_name : str
+        lowercase name with runs of '-', '_' and '.' replaced by '-'
+    """
+
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+def shard_of(name, shards):
+    """Assigns a project to one of n shards
+
+    Uses crc32 of the normalized name, which unlike hash() is the
+    same in every process and every run.
+
+    Parameters:
+    -----------
+    name : str
+        pypi project name
+    shards : int
+        total shards
+
+    Returns:
+    --------
+    shard : int
+        0 to shards - 1
+    """
+
+    return zlib.crc32(normalize_name(name).encode('utf-8')) % shards
+
+def get_index_filepath(csv_filepath):
+    return f"{csv_filepath}.idx"
+
+def tail_digest(csv_file, offset, size=4096):
+    """Hashes the bytes just before offset
+
+    Detects when the csv file was replaced rather than appended to.
+    """
+
+    start = max(0, offset - size)
+    csv_file.seek(start)
+
+    return hashlib.sha1(csv_file.read(offset - start)).hexdigest()
+
+def read_name_index(index_filepath):
+    """Reads a saved name index
+
+    Returns:
+    --------
+    header : dict
+        csv_size and csv_digest of the csv file when the index was saved
+    names : set
+        normalized project names
+    """
+
+    with open(index_filepath, 'r', encoding='utf-8') as index_file:
+        header = json.loads(index_file.readline())
+        names = set(index_file.read().splitlines())
+
+    return header, names
+
+def save_name_index(index_filepath, header, names):
+    """Saves the name index; replaces the old index in one step"""
+
+    tmp_filepath = f"{index_filepath}.{os.getpid()}.tmp"
+    with open(tmp_filepath, 'w', encoding='utf-8', newline='\n') as index_file:
+        index_file.write(json.dumps(header) + '\n')
+        index_file.write('\n'.join(sorted(names)))
+
+    os.replace(tmp_filepath, index_filepath)
+
+def load_name_index(csv_filepath):
+    """Loads the normalized names of projects already in the data set
+
+    The names are saved next to the csv file in a .idx file along
+    with the csv size it covers. Later loads only read the rows appended
+    since then; the full csv is read again only when it was replaced.
+
+    Parameters:
+    -----------
+    csv_filepath : str
+        pypi data csv file path
+
+    Returns:
+    --------
+    names : set
+        normalized pypi project names
+    """
+
+    if not os.path.exists(csv_filepath):
+        return set()
+
+    index_filepath = get_index_filepath(csv_filepath)
+    csv_size = os.path.getsize(csv_filepath)
+
+    names = set()
+    offset = 0
+
+    with open(csv_filepath, 'rb') as csv_file:
+        if os.path.exists(index_filepath):
+            try:
+                header, index_names = read_name_index(index_filepath)
+            except (ValueError, OSError):
+                header = {}
+
+            indexed_size = header.get('csv_size', -1)
+            if (header.get('version') == INDEX_VERSION and 0 < indexed_size <= csv_size
+                    and header.get('csv_digest') == tail_digest(csv_file, indexed_size)):
+                names = index_names
+                offset = indexed_size
+            else:
+                print(f"rebuilding name index: {index_filepath}")
+
+        if offset == csv_size:
+            return names
+
+        csv_file.seek(offset)
+        csv_text = io.TextIOWrapper(csv_file, encoding='utf-8', newline='')
+        csv_reader = csv.reader(csv_text, delimiter=',')
+        if offset == 0:
+            next(csv_reader, None) # skip headers
+
+        for row in csv_reader:
+            if len(row) > NAME_COLUMN:
+                names.add(normalize_name(row[NAME_COLUMN]))
+
+        csv_text.detach()
+        header = {'version': INDEX_VERSION,
+                  'csv_size': csv_size,
+                  'csv_digest': tail_digest(csv_file, csv_size)}
+
+    save_name_index(index_filepath, header, names)
+
+    return names
+
+def download_simple_index(simple_index_file=SIMPLE_INDEX_FILE, session=requests):
+    """Saves the pypi simple index to disk unless the saved copy is current
+
+    Asks for the PEP 691 JSON format and sends the saved ETag so an
+    unchanged index is not downloaded again. The response is streamed
+    straight to disk.
+
+    Parameters:
+    -----------
+    simple_index_file : str
+        file the index is saved to; its ETag is saved in a .meta file
+    session : requests.Session
+        session used for the download; not a CachedSession
+
+    Returns:
+    --------
+    meta : dict
+        etag, last_modified and content_type of the saved index
+    """
+
+    meta_file = f"{simple_index_file}.meta"
+    meta = {}
+    if os.path.exists(simple_index_file) and os.path.exists(meta_file):
+        with open(meta_file, 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+
+    headers = {'Accept': f"{SIMPLE_JSON}, text/html;q=0.1"}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    with session.get(SIMPLE_URL, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            print(f"pypi simple index not modified: {simple_index_file}")
+            return meta
+
+        response.raise_for_status()
+
+        tmp_file = f"{simple_index_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as file:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                file.write(chunk)
+        os.replace(tmp_file, simple_index_file)
+
+        meta = {'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'content_type': response.headers.get('Content-Type', '')}
+
+    with open(meta_file, 'w', encoding='utf-8') as file:
+        json.dump(meta, file)
+
+    print(f"pypi simple index saved: {simple_index_file}")
+
+    return meta
+
+def iter_simple_json(simple_index_file):
+    """Yields project names from a saved PEP 691 JSON index
+
+    Decodes one project object at a time so the whole index is
+    never held in memory.
+    """
+
+    decoder = json.JSONDecoder()
+    with open(simple_index_file, 'r', encoding='utf-8') as file:
+        buffer = ''
+        start = -1
+        while start == -1:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            buffer += chunk
+            start = buffer.find('"projects"')
+
+        # move past the opening bracket of the projects list
+        while True:
+            bracket = buffer.find('[', start)
+            if bracket != -1:
+                position = bracket + 1
+                break
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            buffer += chunk
+
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+
+            if position < len(buffer) and buffer[position] == ']':
+                return
+
+            try:
+                project, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # project split across chunks.. read more
+                chunk = file.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+
+            yield project['name']
+
+def iter_simple_html(simple_index_file):
+    """Yields project names from a saved html index, one line at a time"""
+
+    with open(simple_index_file, 'r', encoding='utf-8') as file:
+        for line in file:
+            if 'href' in line:
+                parts = line.split('">')
+                yield html.unescape(parts[1].split('</a>')[0])
+
+def iter_simple_index(simple_index_file=SIMPLE_INDEX_FILE):
+    """Yields every project from the saved simple index
+
+    Parameters:
+    -----------
+    simple_index_file : str
+        file saved by download_simple_index
+
+    Returns:
+    --------
+    pypi_projects : iterator
+        dicts with package name and package url, like pypilib.get_simple
+    """
+
+    with open(f"{simple_index_file}.meta", 'r', encoding='utf-8') as file:
+        meta = json.load(file)
+
+    if 'json' in meta.get('content_type', ''):
+        names = iter_simple_json(simple_index_file)
+    else:
+        names = iter_simple_html(simple_index_file)
+
+    for project_name in names:
+        yield {'name': project_name, 'url': f"https://pypi.org/project/{project_name}/"}
+
+def iter_shard_index(simple_index_file, shard, shards):
+    """Yields the projects of the saved simple index that belong to one shard"""
+
+    for pypi_project in iter_simple_index(simple_index_file):
+        if shard_of(pypi_project['name'], shards) == shard:
+            yield pypi_project
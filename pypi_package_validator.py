@@ -5,9 +5,19 @@ import textwrap
 import requests
 import time
 import concurrent.futures
+import asyncio
+from http_client import create_session, create_http2_client
+from concurrency_controller import AIMDController, is_overload_error, is_overload_status
+from http_cache import ResponseCache, CACHE_FILE
+from pypi_index import download_simple_index, iter_simple_index, normalize_name, SIMPLE_INDEX_FILE
+from validation_store import ValidationStore, select_due_urls, STORE_FILE
 
 CONNECTIONS = 100
-TIMEOUT = 5
+TIMEOUT = 5 # seconds to connect and seconds to wait for a response
+PROGRESS_URLS = 10000 # urls between progress prints in async mode
+ADAPTIVE_START = 10 # connections an adaptive run starts with
+MAX_RETRIES = 3 # rounds of retries for urls that failed
+RETRY_DELAY = 5 # seconds before the first retry round; doubles each round
 
 def get_args():
     parser = argparse.ArgumentParser(
@@ -16,12 +26,27 @@ def get_args():
         epilog=textwrap.dedent('''Examples:
         pypi_package_validator.py -f "pypi_info_main_db.csv"
         pypi_package_validator.py -f 'pypi_info_main_db.csv' -tmp
+        pypi_package_validator.py -f 'pypi_info_main_db.csv' --no_cache
+        pypi_package_validator.py -f 'pypi_info_main_db.csv' --http2
+        pypi_package_validator.py -f 'pypi_info_main_db.csv' --async
+        pypi_package_validator.py -f 'pypi_info_main_db.csv' --async --adaptive
+        pypi_package_validator.py -f 'pypi_info_main_db.csv' --simple
+        pypi_package_validator.py -f 'pypi_info_main_db.csv' --ttl
         ''')
     )
 
     parser.add_argument('-f', '--file', action='store', type=str, required=True, help="CSV filepath")
     parser.add_argument('-o', '--output', action='store', type=str, required=False, help="New CSV file name")
     parser.add_argument('-tmp', '--tmpfile', action='store_true', required=False, help="Use this if progress was stopped and you need to resume progress")
+    parser.add_argument('--cache', action='store', type=str, default=CACHE_FILE, help=f"http response cache file; default {CACHE_FILE}")
+    parser.add_argument('--no_cache', action='store_true', help="send every request instead of using the response cache")
+    parser.add_argument('-a', '--async', dest='async_mode', action='store_true', help="keep CONNECTIONS requests in flight across the whole url list and save each result as it arrives")
+    parser.add_argument('--adaptive', action='store_true', help="with --async, start with fewer connections and adapt up to CONNECTIONS to how pypi.org responds")
+    parser.add_argument('--simple', action='store_true', help="check names against the pypi simple index first; only ambiguous urls get a request")
+    parser.add_argument('--simple_index', action='store', type=str, default=SIMPLE_INDEX_FILE, help=f"file the pypi simple index is saved to; default {SIMPLE_INDEX_FILE}")
+    parser.add_argument('--ttl', action='store_true', help="only check urls whose last result is older than its time to live; recently uploaded packages are checked more often")
+    parser.add_argument('--store', action='store', type=str, default=STORE_FILE, help=f"file the last result of each url is kept in; default {STORE_FILE}")
+    parser.add_argument('--http2', action='store_true', help="multiplex requests over HTTP/2 with httpx; skips the response cache")
 
     args = parser.parse_args() # parse arguments
 
@@ -38,6 +63,19 @@ def main():
     new_csv_file_name = args['output']
     tmp_validator_file = args['tmpfile']
 
+    session = None
+    if args['http2']:
+        session = create_http2_client(CONNECTIONS, (TIMEOUT, TIMEOUT))
+
+    # responses saved from earlier runs
+    cache = None
+    if session is None:
+        if not args['no_cache']:
+            cache = ResponseCache(args['cache'])
+
+        # one keep-alive pool of CONNECTIONS per host shared by every thread
+        session = create_session(CONNECTIONS, cache, timeout=(TIMEOUT, TIMEOUT))
+
     validated_out_rows = []
     work_num_urls = 10000 # the number of urls to work at one time
 
@@ -45,41 +83,83 @@ def main():
     all_urls = get_urls_from_csvfile(input_csv)
 
     # if progress was stopped, then read in the previously worked urls
+    worked_urls = set()
     if tmp_validator_file:
-        total_elements = read_validator_tmp_file()
-        del all_urls[:total_elements] # remove urls previously worked
+        worked_urls = read_validator_tmp_file()
+        all_urls = [url for url in all_urls if url not in worked_urls] # remove urls previously worked
+        print(f"resuming with {len(all_urls)} urls left; {len(worked_urls)} urls previously worked")
+
+    # skip urls validated recently enough
+    store = None
+    trusted_results = {}
+    if args['ttl']:
+        store = ValidationStore(args['store'])
+        trusted_results, due_urls = select_due_urls(input_csv, store)
+        all_urls = [url for url in due_urls if url not in worked_urls]
+        worked_urls = worked_urls | trusted_results.keys()
+
+    # settle most urls with one download of the simple index
+    if args['simple']:
+        download_simple_index(args['simple_index'])
+        settled_urls, all_urls = diff_simple_index(input_csv, args['simple_index'], worked_urls)
+        if settled_urls:
+            save_worked_urls(settled_urls)
 
     validated_batches = 1
 
-    # validate urls
-    while len(all_urls) > 0:
-        first_10000_urls = all_urls[:work_num_urls] # grab urls to work
-        del all_urls[:work_num_urls] # remove urls we worked
-
-        batch_time = time.time()
-        # start concurrent work
-        with concurrent.futures.ThreadPoolExecutor(max_workers=CONNECTIONS) as executor:
-            future_to_url = (executor.submit(resolve_package, url) for url in first_10000_urls)
-
-            for future in concurrent.futures.as_completed(future_to_url):
-                try:
-                    data = future.result()
-                except Exception as exc:
-                    print(str(type(exc)))
-                finally:
-                    validated_out_rows.append(data)
+    failed_urls = [] # urls to retry once every url was tried
+
+    if args['async_mode']:
+        total_validated, failed_urls = asyncio.run(validate_urls_async(all_urls, session, adaptive=args['adaptive']))
+    else:
+        # validate urls
+        while len(all_urls) > 0:
+            first_10000_urls = all_urls[:work_num_urls] # grab urls to work
+            del all_urls[:work_num_urls] # remove urls we worked
+
+            batch_time = time.time()
+            # start concurrent work
+            with concurrent.futures.ThreadPoolExecutor(max_workers=CONNECTIONS) as executor:
+                future_to_url = {executor.submit(resolve_package, url, session): url for url in first_10000_urls}
+
+                for future in concurrent.futures.as_completed(future_to_url):
+                    url = future_to_url[future]
+                    try:
+                        validated_out_rows.append(future.result())
+                    except Exception as exc:
+                        print(f"failed url: {url}; reason: {type(exc).__name__}")
+                        failed_urls.append(url)
         
-        print(f"--- Validated Batch Num {validated_batches} Completed in {time.time() - batch_time} seconds ---")
-        validated_batches += 1
+            print(f"--- Validated Batch Num {validated_batches} Completed in {time.time() - batch_time} seconds ---")
+            validated_batches += 1
 
-        # save project urls we worked to file
-        save_worked_urls(validated_out_rows)
-        validated_out_rows = []
+            # save project urls we worked to file
+            save_worked_urls(validated_out_rows)
+            validated_out_rows = []
+
+    # try the failed urls again and save each with its final status
+    if failed_urls:
+        retried_rows, total_retries = retry_failed_urls(failed_urls, session)
+        save_worked_urls(retried_rows)
+        gave_up = sum(1 for data in retried_rows if data['package_exists'] == 'Error')
+        print(f"total retries: {total_retries}; urls recovered: {len(retried_rows) - gave_up}; urls still failing: {gave_up}")
 
     # yay we validated all the urls!
     print(f"--- Validated Urls Completed in {time.time() - start_time} seconds ---")
+    if cache:
+        print(f"response cache {cache.report()}")
+        cache.close()
+    session.close()
+
     # read in the pypi urls that no longer exist
     invalid_urls = read_validated_non_existent_urls()
+    invalid_urls |= {url for url, package_exists in trusted_results.items() if not package_exists}
+
+    # remember when each url was validated
+    if store:
+        total_saved = store.save(read_validator_results(), time.time())
+        print(f"validation results saved: {total_saved}; {args['store']}")
+        store.close()
 
     # save new csv with only valid urls
     save_valid_urls(input_csv, invalid_urls, new_csv_file_name)
@@ -91,7 +171,212 @@ def main():
     print(f"--- Script Completed in {time.time() - start_time} seconds ---")
    
 
-def resolve_package(pypi_url):
+async def validate_urls_async(all_urls, session, connections=CONNECTIONS, adaptive=False):
+    """Validates every url with a steady number of requests in flight
+
+    A new request starts as soon as any request finishes, so one
+    slow url never holds up the others. Each result is appended to
+    the tmp file as soon as it arrives. In adaptive mode the number
+    of requests in flight grows while pypi.org answers quickly and is
+    cut on 429s, 5xxs and timeouts.
+
+    Parameters:
+    -----------
+    all_urls : list
+        pypi package urls to validate
+    session : CachedSession
+        shared session or http2 client
+    connections : int
+        max requests in flight
+    adaptive : bool
+        adapt the requests in flight between 1 and connections
+
+    Returns:
+    --------
+    total_validated : int
+        total urls validated
+    failed_urls : list
+        urls that failed and were not saved
+    """
+
+    start_time = time.time()
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=connections))
+
+    if adaptive:
+        controller = AIMDController('pypi.org', ADAPTIVE_START, 1, connections)
+    else:
+        controller = AIMDController('pypi.org', connections, connections, connections)
+
+    file_name = "validator_worked_urls.tmp"
+    file_exists = os.path.exists(file_name)
+    field_names = ['pypi_url', 'package_exists']
+    total_validated = 0
+    failed_urls = []
+
+    with open(file_name, 'a', encoding='utf-8', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=field_names)
+        if not file_exists:
+            writer.writeheader()
+
+        async def validate(url, slot):
+            nonlocal total_validated
+            try:
+                data = await asyncio.to_thread(resolve_package, url, session, slot)
+            except Exception as exc:
+                if is_overload_error(exc):
+                    slot.overloaded = True
+                print(f"failed url: {url}; reason: {type(exc).__name__}")
+                failed_urls.append(url)
+                return
+            finally:
+                controller.release(slot)
+
+            # save each result as it arrives
+            writer.writerow(data)
+            csvfile.flush()
+
+            total_validated += 1
+            if total_validated % PROGRESS_URLS == 0:
+                print(f"--- Validated {total_validated} urls in {time.time() - start_time} seconds ---")
+
+        tasks = set()
+        for url in all_urls:
+            slot = await controller.acquire() # wait for a free slot
+            task = asyncio.create_task(validate(url, slot))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        await asyncio.gather(*tasks)
+
+    print(f"tmp urls saved: {file_name}")
+    if adaptive:
+        print(f"pypi.org {controller.report()}")
+
+    return total_validated, failed_urls
+
+def retry_failed_urls(failed_urls, session):
+    """Retries urls that failed with a connection error, timeout, 429 or 5xx
+
+    Failed urls wait in a queue until every url was tried once, then
+    are retried in rounds with a growing delay between rounds.
+    Urls still failing after the last round are given the status Error.
+
+    Parameters:
+    -----------
+    failed_urls : list
+        pypi package urls that failed
+    session : CachedSession
+        shared session or http2 client
+
+    Returns:
+    --------
+    validated_out_rows : list
+        contains a dict of each url with its final status
+    total_retries : int
+        total requests retried
+    """
+
+    validated_out_rows = []
+    total_retries = 0
+
+    for attempt in range(MAX_RETRIES):
+        if not failed_urls:
+            break
+
+        delay = RETRY_DELAY * (2 ** attempt)
+        print(f"retrying {len(failed_urls)} failed urls in {delay} seconds")
+        time.sleep(delay)
+
+        total_retries += len(failed_urls)
+        still_failed = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=CONNECTIONS) as executor:
+            future_to_url = {executor.submit(resolve_package, url, session): url for url in failed_urls}
+
+            for future in concurrent.futures.as_completed(future_to_url):
+                url = future_to_url[future]
+                try:
+                    validated_out_rows.append(future.result())
+                except Exception:
+                    still_failed.append(url)
+
+        failed_urls = still_failed
+
+    for url in failed_urls:
+        print(f"giving up on url: {url}")
+        validated_out_rows.append({'pypi_url': url, 'package_exists': 'Error'})
+
+    return validated_out_rows, total_retries
+
+def diff_simple_index(csv_filepath, simple_index_file, worked_urls=None):
+    """Settles which pypi urls exist from the pypi simple index
+
+    The simple index lists every live project, so a row whose name
+    is listed as is, with a matching package url, exists, and a row
+    whose name is not listed at all, even after normalization, does
+    not. Only the rest are left to be resolved one request at a time:
+    names listed only after normalization and package urls that don't
+    match the name.
+
+    Parameters:
+    -----------
+    csv_filepath : str
+        file path to CSV file
+    simple_index_file : str
+        file saved by download_simple_index
+    worked_urls : set
+        urls already worked; skipped
+
+    Returns:
+    --------
+    settled_urls : list
+        contains a dict of each url settled, like resolve_package
+    ambiguous_urls : list
+        pypi package urls still to be resolved
+    """
+
+    worked_urls = worked_urls or set()
+
+    project_names = set()
+    normalized_names = set()
+    for pypi_project in iter_simple_index(simple_index_file):
+        project_names.add(pypi_project['name'])
+        normalized_names.add(normalize_name(pypi_project['name']))
+
+    settled_urls = []
+    ambiguous_urls = []
+    seen_urls = set()
+    live = 0
+    missing = 0
+
+    with open(csv_filepath, 'r', encoding='utf-8') as csvfile:
+        csv_reader = csv.reader(csvfile)
+        next(csv_reader) # skip headers
+
+        for row in csv_reader:
+            name = row[15]
+            url = row[17]
+            if url in worked_urls or url in seen_urls:
+                continue
+            seen_urls.add(url)
+
+            if url != f"https://pypi.org/project/{name}/":
+                ambiguous_urls.append(url) # url of some other project
+            elif name in project_names:
+                settled_urls.append({'pypi_url': url, 'package_exists': True})
+                live += 1
+            elif normalize_name(name) in normalized_names:
+                ambiguous_urls.append(url)
+            else:
+                settled_urls.append({'pypi_url': url, 'package_exists': False})
+                missing += 1
+
+    print(f"pypi simple index: {len(project_names)} projects")
+    print(f"urls live: {live}, no longer exist: {missing}, left to resolve: {len(ambiguous_urls)}")
+
+    return settled_urls, ambiguous_urls
+
+def resolve_package(pypi_url, session=requests, slot=None):
     """Resolves the pypi package url
     
     Concurrent will run this function. 
@@ -100,15 +385,29 @@ def resolve_package(pypi_url):
     -----------
     pypi_url : str
         pypi package url
+    session : CachedSession
+        shared session or http2 client; default sends a one-off request
+    slot : Slot
+        AIMDController slot told about throttled responses; default None
 
     Returns:
     --------
     pypi_package_data : dict
         contains pypi package url and whether the package still exists
+
+    Raises:
+    -------
+    requests.exceptions.HTTPError
+        pypi.org answered 429 or 5xx, which says nothing about the package
     """
     package_exists = True
     
-    response = requests.head(pypi_url)
+    response = session.head(pypi_url)
+    if slot is not None:
+        slot.check_status(response.status_code)
+
+    if is_overload_status(response.status_code):
+        raise requests.exceptions.HTTPError(f"{response.status_code} response from {pypi_url}")
 
     if response.status_code == 404:
         package_exists = False
@@ -168,39 +467,86 @@ def save_worked_urls(data):
     print(f"tmp urls saved: {file_name}")
 
 def read_validator_tmp_file():
-    """Reads in the tmp file of urls already worked to prevent double work
+    """Reads in the urls already worked to prevent double work
+
+    Results are saved in the order they finish rather than the order
+    of the pypi Db, so the urls themselves are read back, not a count.
+    A row cut off by a stopped run is removed so new results start
+    on a fresh line.
 
     Returns:
     --------
-    total_elements : int
-        total number of rows containing a url
+    worked_urls : set
+        urls with a saved result, including urls that gave up with Error
     """
     
     tmp_validator_file = 'validator_worked_urls.tmp'
+    worked_urls = set()
+
+    if not os.path.exists(tmp_validator_file):
+        return worked_urls
+
+    # drop a row that was only partly written
+    with open(tmp_validator_file, 'rb+') as tmpfile:
+        data = tmpfile.read()
+        if data and not data.endswith(b'\n'):
+            tmpfile.truncate(data.rfind(b'\n') + 1)
+
+    # not even the headers were saved.. start over
+    if os.path.getsize(tmp_validator_file) == 0:
+        os.remove(tmp_validator_file)
+        return worked_urls
+
     with open(tmp_validator_file, 'r', encoding='utf-8') as csvfile:
         csv_reader = csv.reader(csvfile)
-        next(csv_reader) # skip headers
+        next(csv_reader, None) # skip headers
 
-        total_rows = 0
         for row in csv_reader:
-            if row != '':
-                total_rows += 1
-
-        total_elements = total_rows - 1
+            if len(row) == 2 and row[1] in ('True', 'False', 'Error'):
+                worked_urls.add(row[0])
     
-    return total_elements
+    return worked_urls
+
+def read_validator_results():
+    """Reads in every result saved to the tmp file
+
+    Returns:
+    --------
+    results : list
+        (pypi_url, package_exists) tuples; urls that gave up with Error are left out
+    """
+
+    tmp_validator_file = 'validator_worked_urls.tmp'
+    results = []
+
+    if not os.path.exists(tmp_validator_file):
+        return results
+
+    with open(tmp_validator_file, 'r', encoding='utf-8') as csvfile:
+        csv_reader = csv.reader(csvfile)
+        next(csv_reader, None) # skip headers
+
+        for row in csv_reader:
+            if len(row) == 2 and row[1] in ('True', 'False'):
+                results.append((row[0], row[1] == 'True'))
+
+    return results
 
 def read_validated_non_existent_urls():
     """Reads in the tmp file of invalid urls to be removed from the pypi db
 
     Returns:
     --------
-    invalid_urls : list
-        list of invalid urls
+    invalid_urls : set
+        invalid urls
     """
     
     tmp_validator_file = 'validator_worked_urls.tmp'
-    invalid_urls = []
+    invalid_urls = set()
+
+    # every url was skipped or trusted.. nothing was saved
+    if not os.path.exists(tmp_validator_file):
+        return invalid_urls
     
     with open(tmp_validator_file, 'r', encoding='utf-8') as csvfile:
         csv_reader = csv.reader(csvfile)
@@ -210,55 +556,70 @@ def read_validated_non_existent_urls():
             url = row[0]
             exists = row[1]
             if exists == 'False':
-                invalid_urls.append(url)
+                invalid_urls.add(url)
     
     return invalid_urls
 
 def save_valid_urls(input_csv, invalid_urls, new_csv_file_name):
     """Removes non existent pypi urls from the pypi DB
 
-    Compares the pypi urls from the pypi Db to the invalid_urls.
-    If url does not exist, then discard it.
-    Saves new CSV with only valid pypi urls.
+    Streams the pypi Db row by row, writing each row with a valid url
+    straight to the new file, so memory use does not grow with the file.
+    Prints a summary report once the new file is saved.
 
     Parameters:
     -----------
     input_csv : str
         pypi Db file
-    invalid_urls : list
-        list of invalid urls
+    invalid_urls : set
+        invalid urls
     new_csv_file_name : str
         new pypi Db file
+
+    Returns:
+    --------
+    report : dict
+        total rows read, kept and removed
     """
     
+    start_time = time.time()
+    invalid_urls = set(invalid_urls)
+    removed_urls = set()
+
     with open(input_csv, 'r', encoding='utf-8') as input_csv_file:
         with open(new_csv_file_name, 'w', encoding='utf-8') as new_csv_file:
             csv_reader = csv.reader(input_csv_file)
             csv_writer = csv.writer(new_csv_file, lineterminator='\n')
 
-            row_count = 1
+            headers = next(csv_reader, None)
+            if headers is not None:
+                csv_writer.writerow(headers) # add headers to new file
+
+            total_rows = 0
             skipped_rows = 0
-            out = []
 
             for row in csv_reader:
-                if row_count == 1:
-                    out.append(row) # add headers to new file
+                total_rows += 1
+                pypi_url = row[17]
+
+                if pypi_url in invalid_urls:
+                    skipped_rows += 1
+                    removed_urls.add(pypi_url)
                 else:
-                    # work csv rows
-                    pypi_url = row[17]
-
-                    if pypi_url not in invalid_urls:
-                        out.append(row)
-                    else:
-                        skipped_rows += 1
-                        print(f"package no longer exists: {pypi_url}")
-                
-                row_count += 1
-            
-            csv_writer.writerows(out) # write new csv file
-            print(f"file saved: {new_csv_file_name}")
-            print(f"total rows validated: {row_count}")
-            print(f"total invalid pypi urls removed: {skipped_rows}")
+                    csv_writer.writerow(row)
+
+    report = {'total_rows': total_rows,
+              'kept_rows': total_rows - skipped_rows,
+              'removed_rows': skipped_rows}
+
+    print(f"file saved: {new_csv_file_name}")
+    print(f"total rows validated: {report['total_rows']}")
+    print(f"total rows kept: {report['kept_rows']}")
+    print(f"total invalid pypi urls removed: {report['removed_rows']}")
+    print(f"invalid pypi urls not in the data set: {len(invalid_urls - removed_urls)}")
+    print(f"--- Saved valid urls in {time.time() - start_time} seconds ---")
+
+    return report
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
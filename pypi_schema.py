@@ -0,0 +1,40 @@
+# columns of the pypi data csv file, in order, with the kind of value each holds
+#   number : whole number; empty means 0
+#   text   : any text; empty means none
+#   url    : a url; empty means none
+#   list   : comma separated values without brackets; empty means none
+#   date   : yyyy-mm-dd
+#   time   : HH:MM:SS
+#   raw    : kept as is
+SCHEMA = [('dependent_repos_count', 'number'),
+          ('dependents_count', 'number'),
+          ('deprecation_reason', 'text'),
+          ('description', 'text'),
+          ('forks', 'number'),
+          ('homepage', 'url'),
+          ('keywords', 'list'),
+          ('language', 'text'),
+          ('latest_download_url', 'url'),
+          ('latest_release_number', 'text'),
+          ('latest_release_published_at', 'text'),
+          ('latest_stable_release_number', 'text'),
+          ('latest_stable_release_published_at', 'text'),
+          ('license_normalized', 'text'),
+          ('licenses', 'text'),
+          ('name', 'text'),
+          ('normalized_licenses', 'list'),
+          ('package_manager_url', 'url'),
+          ('platform', 'text'),
+          ('rank', 'number'),
+          ('repository_license', 'text'),
+          ('repository_status', 'text'),
+          ('repository_url', 'url'),
+          ('stars', 'number'),
+          ('status', 'raw'),
+          ('total_versions', 'number'),
+          ('maintainers', 'list'),
+          ('latest_upload_date', 'date'),
+          ('latest_upload_time', 'time'),
+          ('first_upload_date', 'date')]
+
+FIELD_NAMES = [name for name, kind in SCHEMA]
@@ -0,0 +1,232 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+class TokenBucket:
+    """Thread safe token bucket
+
+    Tokens refill at a steady rate up to the bucket capacity.
+    Each request takes one token; callers that find the bucket empty
+    reserve the next token and sleep until it is available.
+
+    Parameters:
+    -----------
+    rate : float
+        tokens added per second
+    capacity : int
+        max tokens the bucket holds; the largest burst allowed
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def acquire(self):
+        """Take one token, sleeping until one is available
+
+        Returns:
+        --------
+        wait : float
+            seconds spent waiting for the token
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            self.tokens -= 1
+            wait = (self.updated - now) + max(0.0, -self.tokens) / self.rate
+
+        if wait > 0:
+            time.sleep(wait)
+
+        return max(wait, 0.0)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for a number of seconds
+
+        Used when the server tells us to back off so every caller
+        sharing the bucket waits, not just the one that was throttled.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            until = now + seconds
+            if until > self.updated:
+                self.updated = until
+            # one request may go as soon as the pause ends
+            self.tokens = 1
+
+def parse_retry_after(value):
+    """Converts a Retry-After header to seconds
+
+    Parameters:
+    -----------
+    value : str
+        header value; delay seconds or an HTTP date
+
+    Returns:
+    --------
+    seconds : float
+        seconds to wait; None if the header is missing or invalid
+    """
+
+    if not value:
+        return None
+
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_date.tzinfo is None:
+        retry_date = retry_date.replace(tzinfo=timezone.utc)
+
+    return max(0.0, (retry_date - datetime.now(timezone.utc)).total_seconds())
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=300.0):
+    """Exponential backoff with full jitter
+
+    Parameters:
+    -----------
+    attempt : int
+        number of retries already made; starts at 0
+    base_delay : float
+        seconds for the first retry
+    max_delay : float
+        max seconds for any retry
+
+    Returns:
+    --------
+    delay : float
+        random seconds between 0 and the capped exponential delay
+    """
+
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+class RateLimiter:
+    """Keeps requests to an api at its quota and backs off on failures
+
+    Tracks how much time is spent waiting on the quota or backoff
+    compared to time spent working on requests.
+
+    Parameters:
+    -----------
+    requests_per_minute : int
+        api quota
+    burst : int
+        max requests sent back to back; default 1 spaces requests evenly
+    base_delay : float
+        seconds for the first retry without a server hint
+    max_delay : float
+        max seconds for any retry
+    """
+
+    def __init__(self, requests_per_minute, burst=1, base_delay=1.0, max_delay=300.0):
+        self.bucket = TokenBucket(requests_per_minute / 60, burst)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.lock = threading.Lock()
+        self.wait_time = 0.0
+        self.work_time = 0.0
+        self.backoff_time = 0.0
+        self.requests = 0
+        self.retries = 0
+
+    def acquire(self):
+        """Wait for a request slot under the quota"""
+
+        wait = self.bucket.acquire()
+        with self.lock:
+            self.wait_time += wait
+            self.requests += 1
+
+    @contextmanager
+    def working(self):
+        """Time a request as work"""
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.work_time += time.monotonic() - start
+
+    def backoff(self, attempt, retry_after=None):
+        """Wait before retrying a failed request
+
+        Follows the server's Retry-After hint when given by pausing
+        the shared bucket, so the wait happens in the next acquire.
+        Otherwise sleeps a jittered exponential backoff.
+
+        Parameters:
+        -----------
+        attempt : int
+            number of retries already made for this request
+        retry_after : str
+            Retry-After response header
+
+        Returns:
+        --------
+        delay : float
+            seconds until the retry
+        """
+
+        delay = parse_retry_after(retry_after)
+        if delay is not None:
+            # small jitter so workers don't retry at the same instant
+            delay = min(self.max_delay, delay) + random.uniform(0, self.base_delay)
+            with self.lock:
+                self.retries += 1
+                self.backoff_time += delay
+            self.bucket.pause(delay)
+            return delay
+
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+        with self.lock:
+            self.retries += 1
+            self.backoff_time += delay
+            self.wait_time += delay
+
+        time.sleep(delay)
+
+        return delay
+
+    def stats(self):
+        """Returns the time spent waiting versus working
+
+        Returns:
+        --------
+        stats : dict
+            requests, retries, wait_time, work_time, backoff_time
+        """
+
+        with self.lock:
+            return {'requests': self.requests,
+                    'retries': self.retries,
+                    'wait_time': self.wait_time,
+                    'work_time': self.work_time,
+                    'backoff_time': self.backoff_time}
+
+    def report(self):
+        stats = self.stats()
+        return (f"requests: {stats['requests']}, retries: {stats['retries']}, "
+                f"working: {stats['work_time']:.1f} seconds, waiting: {stats['wait_time']:.1f} seconds")
@@ -0,0 +1,213 @@
+import csv
+import heapq
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from pypi_index import normalize_name
+
+DAY = 24 * 3600
+MIN_REFRESH_AGE = 1 # days before a refreshed row can be picked again
+ACTIVE_DAYS = 30 # releases newer than this mark a package as likely to change
+ACTIVITY_WEIGHT = 4 # how much more a just-released package counts than an old one
+
+class RefreshLog:
+    """Remembers when each row of the data set was last refreshed
+
+    Saved in a SQLite file next to the csv file since the csv
+    columns don't have room for it. The log also keeps when it was
+    created; logs from before that use their oldest refresh.
+
+    Parameters:
+    -----------
+    csv_file : str
+        pypi data csv file
+    """
+
+    def __init__(self, csv_file):
+        self.path = f"{csv_file}.refresh.sqlite"
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS refreshed (name TEXT PRIMARY KEY, refreshed_at REAL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS created (created_at REAL)')
+        self.conn.execute('INSERT INTO created SELECT coalesce((SELECT min(refreshed_at) FROM refreshed), ?) '
+                          'WHERE NOT EXISTS (SELECT 1 FROM created)', (time.time(),))
+        self.conn.commit()
+
+    def created_at(self):
+        """Returns the unix timestamp the log was created"""
+
+        return self.conn.execute('SELECT created_at FROM created').fetchone()[0]
+
+    def load(self):
+        """Returns normalized name: last refresh timestamp"""
+
+        return dict(self.conn.execute('SELECT name, refreshed_at FROM refreshed'))
+
+    def mark(self, package_names, refreshed_at):
+        """Records packages as refreshed
+
+        Parameters:
+        -----------
+        package_names : list
+            pypi project names
+        refreshed_at : float
+            unix timestamp
+        """
+
+        self.conn.executemany('INSERT OR REPLACE INTO refreshed VALUES (?, ?)',
+                              [(normalize_name(name), refreshed_at) for name in package_names])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def parse_timestamp(value):
+    """Converts a csv date such as 2022-05-29 or 2022-05-29T11:20:53.000Z to a unix timestamp
+
+    Returns:
+    --------
+    timestamp : float
+        None if the value is not a date
+    """
+
+    try:
+        date = datetime.strptime(value[:10], '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+    return date.replace(tzinfo=timezone.utc).timestamp()
+
+def refresh_priority(now, refreshed_at, released_at):
+    """Scores how much a row needs a refresh
+
+    Staleness in days, boosted for packages with a recent release
+    since they are the most likely to have new versions, stars or
+    maintainers.
+
+    Parameters:
+    -----------
+    now : float
+        unix timestamp
+    refreshed_at : float
+        when the row was last refreshed or collected
+    released_at : float
+        latest release; None if unknown
+
+    Returns:
+    --------
+    priority : float
+        higher is refreshed first
+    """
+
+    stale_days = (now - refreshed_at) / DAY
+
+    activity = 0.0
+    if released_at is not None:
+        release_days = max(0.0, (now - released_at) / DAY)
+        activity = ACTIVE_DAYS / (ACTIVE_DAYS + release_days)
+
+    return stale_days * (1 + ACTIVITY_WEIGHT * activity)
+
+def select_stale_packages(csv_file, refresh_log, budget, now=None):
+    """Picks the rows most in need of a refresh within a request budget
+
+    Rows that were never refreshed count as refreshed when the log was
+    created, and at least MIN_REFRESH_AGE ago, so they share one
+    staleness and the recently released ones are picked first.
+
+    Parameters:
+    -----------
+    csv_file : str
+        pypi data csv file
+    refresh_log : RefreshLog
+        last refresh of each row
+    budget : int
+        max packages to refresh this run
+    now : float
+        unix timestamp; default time.time()
+
+    Returns:
+    --------
+    package_names : list
+        pypi project names, highest priority first
+    """
+
+    if now is None:
+        now = time.time()
+
+    refreshed = refresh_log.load()
+    min_refresh_age = MIN_REFRESH_AGE * DAY
+    never_refreshed_at = min(refresh_log.created_at(), now - min_refresh_age)
+
+    with open(csv_file, 'r', encoding='utf-8', newline='') as input_csv_file:
+        csv_reader = csv.reader(input_csv_file)
+        headers = next(csv_reader)
+        name_column = headers.index('name')
+        release_column = headers.index('latest_release_published_at')
+
+        def candidates():
+            for row in csv_reader:
+                if len(row) != len(headers):
+                    continue
+
+                released_at = parse_timestamp(row[release_column])
+                refreshed_at = refreshed.get(normalize_name(row[name_column]), never_refreshed_at)
+
+                if now - refreshed_at < min_refresh_age:
+                    continue
+
+                yield refresh_priority(now, refreshed_at, released_at), row[name_column]
+
+        stale_packages = heapq.nlargest(budget, candidates())
+
+    return [package_name for priority, package_name in stale_packages]
+
+def upsert_rows(csv_file, field_names, rows):
+    """Replaces rows of the csv file with refreshed rows
+
+    The csv file is rewritten row by row to a temp file which then
+    replaces the csv file in one step.
+
+    Parameters:
+    -----------
+    csv_file : str
+        pypi data csv file
+    field_names : list
+        csv headers
+    rows : dict
+        normalized name: refreshed row dict
+
+    Returns:
+    --------
+    replaced_rows : int
+        total rows replaced
+    """
+
+    tmp_csv_file = f"{csv_file}.refresh.tmp"
+    replaced_rows = 0
+
+    with open(csv_file, 'r', encoding='utf-8', newline='') as input_csv_file:
+        with open(tmp_csv_file, 'w', encoding='utf-8', newline='') as new_csv_file:
+            csv_reader = csv.reader(input_csv_file)
+            csv_writer = csv.writer(new_csv_file)
+            dict_writer = csv.DictWriter(new_csv_file, fieldnames=field_names)
+
+            headers = next(csv_reader)
+            name_column = headers.index('name')
+            csv_writer.writerow(headers)
+
+            for row in csv_reader:
+                package_name = normalize_name(row[name_column]) if len(row) > name_column else None
+                if package_name in rows:
+                    dict_writer.writerow(rows[package_name])
+                    replaced_rows += 1
+                else:
+                    csv_writer.writerow(row)
+
+            new_csv_file.flush()
+            os.fsync(new_csv_file.fileno())
+
+    os.replace(tmp_csv_file, csv_file)
+
+    return replaced_rows
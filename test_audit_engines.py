@@ -0,0 +1,214 @@
+import collections
+import csv
+import io
+import os
+import random
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import audit_pypi_info_db
+import csv_chunks
+import duckdb_audit
+from pypi_schema import FIELD_NAMES, SCHEMA
+
+# values the engines have to agree on, by schema kind
+VALUES = {'number': ['12', '0', '', 'x1', '3.5', ' 7', '+5', '-3', '1_000', '1__0', '_1', '1_', '٣', '7\xa0', '\x1c7', '1 2'],
+          'date': ['2023-01-05', '', 'none', '2023-02-30', '2024-02-29', '2023-2-3', '23-01-01', '2023-13-01', '2023-01-01 ',
+                   '0000-01-01', '2023-01- 1', '１２３４-01-01', '2023-0١-15', '2023-01-1٥', '2023/01/01'],
+          'time': ['12:34:56', '', '1:2', '1:2:3:4', 'aa:bb:cc', '12:00'],
+          'list': ['a, b', '', "['a', 'b']", '[]', '[None]', "'x'"],
+          'text': ['v', '', 'none', 'line one\nline two, "quoted"', 'multi\r\nline', 'bare\rreturn', '\xfc'],
+          'raw': ['active', '']}
+VALUES['url'] = VALUES['text']
+
+def make_row(rng):
+    """A row that is mostly valid, with a bad or tricky value now and then"""
+
+    row = []
+    for name, kind in SCHEMA:
+        if rng.random() < 0.1:
+            row.append(rng.choice(VALUES[kind]))
+        else:
+            row.append(VALUES[kind][0])
+
+    chance = rng.random()
+    if chance < 0.02:
+        row = row[:-1]
+    elif chance < 0.04:
+        row = row + ['extra']
+
+    return row
+
+def write_data_set(path, rows, seed=0, torn_row=None):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='') as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(FIELD_NAMES)
+        for i in range(rows):
+            if i == torn_row:
+                # a row cut off inside a quoted value, like a half written batch
+                csv_file.write('1,2,v,"torn value\n')
+            csv_writer.writerow(make_row(rng))
+
+def read_bytes(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+def read_records(path):
+    with open(path, 'r', encoding='utf-8', newline='') as csv_file:
+        return collections.Counter(tuple(row) for row in csv.reader(csv_file))
+
+class AuditEnginesTest(unittest.TestCase):
+    """Every engine and worker count audits a generated file the same way"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.data_set = cls.path('pypi_info_db.csv')
+        write_data_set(cls.data_set, 3000)
+
+        cls.clean, cls.quarantine = cls.path('clean.csv'), cls.path('quarantine.csv')
+        cls.error_counts = audit_pypi_info_db.audit_file(cls.data_set, cls.clean, cls.quarantine)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    @classmethod
+    def path(cls, name):
+        return os.path.join(cls.tmp_dir.name, name)
+
+    def test_generated_file_has_every_kind_of_error(self):
+        self.assertIn('columns', self.error_counts)
+        for name, kind in SCHEMA:
+            if kind in ('number', 'date', 'time'):
+                self.assertIn(name, self.error_counts)
+
+    def test_chunks_match_single_process(self):
+        for workers in (2, 3):
+            with self.subTest(workers=workers):
+                clean, quarantine = self.path(f'clean{workers}.csv'), self.path(f'quarantine{workers}.csv')
+                error_counts = audit_pypi_info_db.audit_in_chunks(self.data_set, clean, quarantine, workers)
+
+                self.assertEqual(error_counts, self.error_counts)
+                self.assertEqual(read_bytes(clean), read_bytes(self.clean))
+                self.assertEqual(read_bytes(quarantine), read_bytes(self.quarantine))
+
+    def test_chunks_match_single_process_after_torn_row(self):
+        data_set = self.path('torn.csv')
+        write_data_set(data_set, 3000, seed=1, torn_row=1500)
+        clean, quarantine = self.path('clean_torn.csv'), self.path('quarantine_torn.csv')
+        error_counts = audit_pypi_info_db.audit_file(data_set, clean, quarantine)
+
+        for workers in (2, 3):
+            with self.subTest(workers=workers):
+                chunk_clean, chunk_quarantine = self.path(f'clean_torn{workers}.csv'), self.path(f'quarantine_torn{workers}.csv')
+                chunk_error_counts = audit_pypi_info_db.audit_in_chunks(data_set, chunk_clean, chunk_quarantine, workers)
+
+                self.assertEqual(chunk_error_counts, error_counts)
+                self.assertEqual(read_bytes(chunk_clean), read_bytes(clean))
+                self.assertEqual(read_bytes(chunk_quarantine), read_bytes(quarantine))
+
+    def test_empty_file(self):
+        data_set = self.path('empty.csv')
+        open(data_set, 'w').close()
+
+        audits = {'single': lambda clean, quarantine: audit_pypi_info_db.audit_file(data_set, clean, quarantine),
+                  'chunks': lambda clean, quarantine: audit_pypi_info_db.audit_in_chunks(data_set, clean, quarantine, 2)}
+        for name, audit in audits.items():
+            with self.subTest(audit=name):
+                clean, quarantine = self.path(f'clean_empty_{name}.csv'), self.path(f'quarantine_empty_{name}.csv')
+
+                self.assertEqual(audit(clean, quarantine), collections.Counter())
+                self.assertEqual(read_bytes(clean), b'')
+                self.assertEqual(read_bytes(quarantine), b'')
+
+    @unittest.skipIf(duckdb_audit.duckdb is None, "duckdb not installed")
+    def test_duckdb_matches_python(self):
+        clean, quarantine = self.path('clean_duckdb.csv'), self.path('quarantine_duckdb.csv')
+        error_counts = duckdb_audit.audit_with_duckdb(self.data_set, clean, quarantine, SCHEMA)
+
+        self.assertEqual(error_counts, self.error_counts)
+        self.assertEqual(read_bytes(clean), read_bytes(self.clean))
+        # rows with the wrong number of columns come last from duckdb
+        self.assertEqual(read_records(quarantine), read_records(self.quarantine))
+
+    @unittest.skipIf(duckdb_audit.duckdb is None, "duckdb not installed")
+    def test_duckdb_matches_python_after_torn_row(self):
+        data_set = self.path('torn_duckdb.csv')
+        write_data_set(data_set, 3000, seed=1, torn_row=1500)
+        clean, quarantine = self.path('clean_torn_python.csv'), self.path('quarantine_torn_python.csv')
+        error_counts = audit_pypi_info_db.audit_file(data_set, clean, quarantine)
+
+        duckdb_clean, duckdb_quarantine = self.path('clean_torn_duckdb.csv'), self.path('quarantine_torn_duckdb.csv')
+        duckdb_error_counts = duckdb_audit.audit_with_duckdb(data_set, duckdb_clean, duckdb_quarantine, SCHEMA)
+
+        self.assertEqual(duckdb_error_counts, error_counts)
+        self.assertEqual(read_bytes(duckdb_clean), read_bytes(clean))
+        self.assertEqual(read_records(duckdb_quarantine), read_records(quarantine))
+
+    def test_chunk_boundaries_fall_on_records(self):
+        with open(self.data_set, 'rb') as file:
+            data = file.read()
+        rows = list(csv.reader(io.StringIO(data.decode('utf-8'), newline=None)))[1:]
+
+        # small blocks so quoted values cross block edges
+        with mock.patch.object(csv_chunks, 'BLOCK_SIZE', 16):
+            for chunks in (2, 7, 50):
+                with self.subTest(chunks=chunks):
+                    boundaries = csv_chunks.find_chunk_boundaries(self.data_set, chunks)
+
+                    self.assertEqual(boundaries[0][0], data.index(b'\n') + 1)
+                    self.assertEqual(boundaries[-1][1], len(data))
+                    for (start, end), (next_start, next_end) in zip(boundaries, boundaries[1:]):
+                        self.assertEqual(end, next_start)
+
+                    chunk_rows = [row for start, end in boundaries
+                                  for row in csv.reader(io.StringIO(data[start:end].decode('utf-8'), newline=None))]
+                    self.assertEqual(chunk_rows, rows)
+
+class ValueChecksTest(unittest.TestCase):
+    """The schema checks follow int() and strptime, in python and in SQL"""
+
+    def python_is_number(self, value):
+        try:
+            int(value)
+        except ValueError:
+            return False
+        return True
+
+    def python_is_date(self, value):
+        try:
+            datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            return False
+        return True
+
+    def test_python_checks(self):
+        for value in VALUES['number']:
+            self.assertEqual(audit_pypi_info_db.is_number(value), self.python_is_number(value), ascii(value))
+        for value in VALUES['date']:
+            self.assertEqual(audit_pypi_info_db.is_date(value), self.python_is_date(value), ascii(value))
+
+    @unittest.skipIf(duckdb_audit.duckdb is None, "duckdb not installed")
+    def test_sql_checks(self):
+        spaces = [chr(c) for c in range(0x3001) if chr(c).isspace()]
+        numbers = VALUES['number'] + [f'{space}7{space}' for space in spaces]
+        dates = VALUES['date'] + ['2023-02-29', '2023-04-31', '2023-00-10', '2023-1-1', '02023-01-01']
+        checks = [('number', numbers, self.python_is_number),
+                  ('date', dates, self.python_is_date),
+                  ('time', VALUES['time'], audit_pypi_info_db.is_time)]
+
+        with duckdb_audit.duckdb.connect() as conn:
+            for kind, values, python_check in checks:
+                query = f"SELECT {duckdb_audit.check_expression('value', kind)} FROM (SELECT ? AS value)"
+                for value in values:
+                    with self.subTest(kind=kind, value=ascii(value)):
+                        # an empty number is filled in with 0 before the check
+                        expected = python_check(value or ('0' if kind == 'number' else ''))
+                        self.assertEqual(bool(conn.execute(query, [value]).fetchone()[0]), expected)
+
+if __name__ == "__main__":
+    unittest.main()
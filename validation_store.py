@@ -0,0 +1,140 @@
+import csv
+import sqlite3
+import time
+
+from refresh_scheduler import parse_timestamp, DAY
+
+STORE_FILE = 'validator_results.sqlite'
+
+# (uploaded within days, days a result is trusted); newest first
+VALIDATION_TTLS = ((30, 1),
+                   (365, 7))
+STABLE_TTL = 30 # days a result is trusted for packages without an upload in a year
+UNKNOWN_TTL = 7 # days a result is trusted when the upload date is missing
+
+def validation_ttl(latest_upload_date, now=None):
+    """Picks how long a validation result is trusted
+
+    Recently uploaded packages change hands and get deleted more
+    often than packages that have been stable for years.
+
+    Parameters:
+    -----------
+    latest_upload_date : str
+        yyyy-mm-dd from the pypi Db
+    now : float
+        unix timestamp; default time.time()
+
+    Returns:
+    --------
+    ttl : float
+        seconds
+    """
+
+    if now is None:
+        now = time.time()
+
+    uploaded_at = parse_timestamp(latest_upload_date)
+    if uploaded_at is None:
+        return UNKNOWN_TTL * DAY
+
+    upload_days = (now - uploaded_at) / DAY
+    for within_days, ttl_days in VALIDATION_TTLS:
+        if upload_days <= within_days:
+            return ttl_days * DAY
+
+    return STABLE_TTL * DAY
+
+class ValidationStore:
+    """Keeps the last validation result of each pypi url
+
+    Parameters:
+    -----------
+    path : str
+        SQLite file
+    """
+
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS validated (pypi_url TEXT PRIMARY KEY, package_exists INTEGER, last_validated REAL)')
+        self.conn.commit()
+
+    def load(self):
+        """Returns pypi url: (package_exists, last_validated)"""
+
+        return {url: (bool(exists), last_validated)
+                for url, exists, last_validated in self.conn.execute('SELECT pypi_url, package_exists, last_validated FROM validated')}
+
+    def save(self, results, last_validated):
+        """Records validation results
+
+        Parameters:
+        -----------
+        results : iterable
+            (pypi_url, package_exists) tuples
+        last_validated : float
+            unix timestamp
+
+        Returns:
+        --------
+        total_saved : int
+            total results saved
+        """
+
+        rows = [(url, int(exists), last_validated) for url, exists in results]
+        self.conn.executemany('INSERT OR REPLACE INTO validated VALUES (?, ?, ?)', rows)
+        self.conn.commit()
+
+        return len(rows)
+
+    def close(self):
+        self.conn.close()
+
+def select_due_urls(csv_filepath, store, now=None):
+    """Splits the pypi Db urls into results still trusted and urls due for validation
+
+    Parameters:
+    -----------
+    csv_filepath : str
+        file path to CSV file
+    store : ValidationStore
+        last validation results
+    now : float
+        unix timestamp; default time.time()
+
+    Returns:
+    --------
+    trusted_results : dict
+        pypi url: package_exists for urls validated within their ttl
+    due_urls : list
+        pypi urls to validate
+    """
+
+    if now is None:
+        now = time.time()
+
+    last_results = store.load()
+    trusted_results = {}
+    due_urls = []
+
+    with open(csv_filepath, 'r', encoding='utf-8') as csvfile:
+        csv_reader = csv.reader(csvfile)
+        next(csv_reader) # skip headers
+
+        for row in csv_reader:
+            url = row[17]
+            latest_upload_date = row[27] if len(row) > 27 else None
+
+            last_result = last_results.get(url)
+            if last_result is not None:
+                package_exists, last_validated = last_result
+                if now - last_validated <= validation_ttl(latest_upload_date, now):
+                    trusted_results[url] = package_exists
+                    continue
+
+            due_urls.append(url)
+
+    print(f"validation results still trusted: {len(trusted_results)}, urls due: {len(due_urls)}")
+
+    return trusted_results, due_urls